@@ -1,9 +1,16 @@
+import time
+import random
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from fitness import evaluate_population, evaluate_task, init_worker, individual_seeds, FitnessCache
+
 class BaseEvolutionPopulation():
     def __init__(self, individual_class, mu, num_children, mutation_rate,
                  parent_selection, survival_selection,
                  initialization_kwargs=dict(), parent_selection_kwargs=dict(),
                  recombination_kwargs = dict(), mutation_kwargs = dict(),
-                 survival_selection_kwargs=dict(), **kwargs):
+                 survival_selection_kwargs=dict(), fitness_kwargs=dict(),
+                 evaluation_kwargs=dict(), fitness_cache=None, evaluator=evaluate_population, **kwargs):
         self.mu = mu
         self.num_children = num_children
         self.mutation_rate = mutation_rate
@@ -13,25 +20,154 @@ class BaseEvolutionPopulation():
         self.recombination_kwargs = recombination_kwargs
         self.mutation_kwargs = mutation_kwargs
         self.survival_selection_kwargs = survival_selection_kwargs
+        self.fitness_kwargs = fitness_kwargs
+        self.evaluation_kwargs = evaluation_kwargs
+        self.fitness_cache = fitness_cache
+        self.evaluator = evaluator
 
         self.population = individual_class.initialization(self.mu, **initialization_kwargs)
 
-    def generate_children(self):
+    def generate_children(self, num_children=None):
+        if num_children is None:
+            num_children = self.num_children
         children = list()
 
-        # TODO: Select parents
-        # hint: self.parent_selection(self.population, **self.parent_selection_kwargs)
-        pass
+        # Select parents
+        parents = self.parent_selection(self.population, n=2*num_children, **self.parent_selection_kwargs)
 
-        # TODO: Recombine parents to generate children
-        pass
+        # Recombine parents to generate children
+        for idx in range(num_children):
+            children.append(parents[2*idx].recombine(parents[2*idx+1], **self.recombination_kwargs))
 
-        # TODO: Mutate children if appropriate
-        pass
+        # Mutate children if appropriate
+        for idx, child in enumerate(children):
+            if random.random() < self.mutation_rate:
+                children[idx] = child.mutate(**self.mutation_kwargs)
 
         # return children
         return children
 
 
+    def evaluate(self, individuals):
+        # assign fitness through fitness.evaluate_population (or e.g. a fitness.RacingEvaluator), reusing cached results for equivalent trees
+        scores = self.evaluator(individuals, cache=self.fitness_cache, **self.evaluation_kwargs, **self.fitness_kwargs)
+        for individual, score in zip(individuals, scores):
+            individual.fitness = score
+
     def survival(self):
         self.population = self.survival_selection(self.population, self.mu, **self.survival_selection_kwargs)
+
+    def insert(self, child):
+        # steady-state survival: the child competes with the population right away
+        self.population = self.survival_selection(self.population + [child], self.mu, **self.survival_selection_kwargs)
+
+    def run_steady_state(self, max_evaluations, workers=None, in_flight=None, seed=None, log_interval=100, verbose=False, max_children=None):
+        '''
+        Asynchronous steady-state evolution. Up to in_flight games (two per
+        worker by default) are played at once on a pool of workers processes
+        (in this process if 1). As soon as a child's fitness arrives it is
+        inserted with survival_selection and a replacement child is bred
+        from the current population and dispatched, so no worker waits for
+        the slowest game of a generation.
+
+        Children are played one game each with evaluate_population's seeding
+        (all on the run's one game with common_random_numbers), so the
+        evaluator must be evaluate_population. Cached children are inserted
+        without playing and a child equivalent to one still being played
+        waits for that game instead of playing it again. Stops after
+        max_evaluations games were played (the initial population is
+        evaluated first if needed), or after max_children children (10 per
+        evaluation by default) in case the population has converged to
+        cached trees. Every log_interval evaluations, the evaluation and
+        child counts, best and mean fitness and elapsed time are appended to
+        history (and printed if verbose), which is returned. With more than
+        one worker, the result depends on the order games finish in.
+        '''
+        assert self.evaluator is evaluate_population, f"ERROR: UNSUPPORTED STEADY-STATE EVALUATOR {self.evaluator} BUT EXPECTED evaluate_population"
+        workers = self.evaluation_kwargs.get('workers') if workers is None else workers
+        seed = self.evaluation_kwargs.get('seed') if seed is None else seed
+        if seed is None:
+            seed = random.getrandbits(64)
+        if max_children is None:
+            max_children = 10*max_evaluations
+        unevaluated = [individual for individual in self.population if individual.fitness is None]
+        if unevaluated:
+            self.evaluate(unevaluated)
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if in_flight is None:
+            in_flight = 2*max(1, workers)
+
+        start = time.perf_counter()
+        self.history = list()
+        evaluations = 0 # games played
+        children = 0 # children inserted, including cache hits
+
+        def record(child, played):
+            nonlocal evaluations, children
+            self.insert(child)
+            children += 1
+            if not played:
+                return
+            evaluations += 1
+            if evaluations % log_interval == 0 or evaluations == max_evaluations:
+                fitnesses = [individual.fitness for individual in self.population]
+                entry = {'evaluations': evaluations, 'children': children, 'best': max(fitnesses),
+                         'mean': sum(fitnesses)/len(fitnesses), 'elapsed': time.perf_counter() - start}
+                self.history.append(entry)
+                if verbose:
+                    print(f"{entry['evaluations']} evaluations ({entry['children']} children): best {entry['best']}, "
+                          f"mean {entry['mean']:.2f} ({entry['elapsed']:.1f} s)")
+
+        def breed():
+            # returns (child, cache key, task), with no task when the fitness was cached
+            child = self.generate_children(1)[0]
+            gene, canonical_hash = child.canonical()
+            task_seed = individual_seeds(seed, [canonical_hash], self.evaluation_kwargs.get('common_random_numbers', False))[0]
+            key = FitnessCache.make_key(canonical_hash, task_seed, return_log=False, **self.fitness_kwargs)
+            cached = None if self.fitness_cache is None else self.fitness_cache.get(key)
+            if cached is not None:
+                child.fitness = cached
+                return child, key, None
+            return child, key, (gene, task_seed, dict())
+
+        def finish(waiting, key, score):
+            # the first child waiting on a game counts as its evaluation, equivalent children share it
+            if self.fitness_cache is not None:
+                self.fitness_cache.put(key, score)
+            for idx, child in enumerate(waiting):
+                child.fitness = score
+                record(child, idx == 0)
+
+        if workers <= 1:
+            init_worker(self.fitness_kwargs, False)
+            while evaluations < max_evaluations and children < max_children:
+                child, key, task = breed()
+                if task is None:
+                    record(child, False)
+                else:
+                    finish([child], key, evaluate_task(task))
+            return self.history
+
+        pending = dict() # cache key -> (future, children waiting for its game)
+        dispatched = 0 # games submitted
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(self.fitness_kwargs, False)) as pool:
+            while evaluations < max_evaluations and children < max_children:
+                while len(pending) < in_flight and dispatched < max_evaluations and children + sum(len(waiting) for _, waiting in pending.values()) < max_children:
+                    child, key, task = breed()
+                    if task is None:
+                        record(child, False)
+                    elif key in pending:
+                        pending[key][1].append(child)
+                    else:
+                        pending[key] = (pool.submit(evaluate_task, task), [child])
+                        dispatched += 1
+                if not pending:
+                    continue
+                futures = {future: key for key, (future, _) in pending.items()}
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = futures[future]
+                    _, waiting = pending.pop(key)
+                    finish(waiting, key, future.result())
+        return self.history
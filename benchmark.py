@@ -0,0 +1,593 @@
+#!/usr/bin/python3
+
+# use: python3 benchmark.py distance_fields [--maps maps/map*.txt] [--metric manhattan]
+# use: python3 benchmark.py log_levels [--maps maps/map*.txt] [--games 5]
+# use: python3 benchmark.py replay_fps [--maps maps/map*.txt] [--frame_skip 1] [--save replay.gif]
+# use: python3 benchmark.py suite [--maps maps/map*.txt] [--pill_spawn stochastic linear manhattan] [--players 3x1 1x1 4x2] [--out results.json] [--compare baseline.json]
+# use: python3 benchmark.py clones [--map maps/map00.txt] [--rollouts 200] [--depth 20]
+# use: python3 benchmark.py selection [--population 100000] [--k 5]
+# use: python3 benchmark.py startup [--repeats 5] [--workers 4]
+# use: python3 benchmark.py crn [--map maps/map00.txt] [--population 30] [--games 1 2 4] [--truth_games 20] [--trials 10]
+# use: python3 benchmark.py stress [--size 500] [--ghosts 100 300 1000] [--pacs 10] [--turns 50] [--map maps/large.txt]
+# use note: run `python3 benchmark.py -h` for the list of benchmarks
+
+import argparse
+import copy
+import glob
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import gpac
+import fitness
+import map_generator
+import selection
+from tree_genotype import TreeGenotype
+
+
+def brute_force_nearest(game, location, targets):
+    '''nearest target distance by scanning every target, as sensors would without a distance field'''
+    if game.distance_metric == 'maze':
+        distances = [game.compiled_map.maze_distance(location, target) for target in targets]
+    else:
+        distances = [fitness.manhattan_distance(location, target) for target in targets]
+    return min(distances, default=gpac.UNREACHABLE)
+
+def bench_distance_fields(map_paths, seed=0, metric='manhattan', **game_kwargs):
+    '''
+    Plays one random game per map and, for every candidate state of every
+    Pac-Man turn, looks up the nearest pill and fruit distance both by
+    brute-force scanning and through the game's incremental distance
+    fields. Checks that both agree and returns the timings per map. The
+    cost of keeping the fields up to date is measured as the extra step()
+    time over an identical game that never builds them.
+    '''
+    results = list()
+    for map_path in map_paths:
+        random.seed(seed)
+        game = gpac.GPacGame(gpac.load_map(map_path), distance_metric=metric, **game_kwargs)
+        brute_time = field_time = step_time = 0
+        lookups = 0
+        while not game.gameover:
+            for player in game.players:
+                actions = game.get_actions(player)
+                if 'm' in player:
+                    s_primes = game.get_observations(actions, player)
+                    fruit = () if game.fruit_location is None else (game.fruit_location,)
+                    start = time.perf_counter()
+                    brute = [(brute_force_nearest(game, s_prime.location, game.pills), brute_force_nearest(game, s_prime.location, fruit)) for s_prime in s_primes]
+                    brute_time += time.perf_counter() - start
+                    start = time.perf_counter()
+                    field = [(game.nearest_pill_distance(s_prime.location), game.nearest_fruit_distance(s_prime.location)) for s_prime in s_primes]
+                    field_time += time.perf_counter() - start
+                    assert brute == field, f"ERROR: DISTANCE FIELD DISAGREES WITH BRUTE FORCE ON {map_path}"
+                    lookups += len(s_primes)
+                game.register_action(random.choice(actions), player)
+            start = time.perf_counter()
+            game.step()
+            step_time += time.perf_counter() - start
+
+        # identical game without distance fields
+        random.seed(seed)
+        plain_game = gpac.GPacGame(gpac.load_map(map_path), distance_metric=metric, **game_kwargs)
+        plain_step_time = 0
+        while not plain_game.gameover:
+            for player in plain_game.players:
+                actions = plain_game.get_actions(player)
+                plain_game.register_action(random.choice(actions), player)
+            start = time.perf_counter()
+            plain_game.step()
+            plain_step_time += time.perf_counter() - start
+        field_time += max(0, step_time - plain_step_time)
+        results.append({'map': map_path, 'lookups': lookups, 'brute_force_s': brute_time, 'field_s': field_time})
+    return results
+
+def bench_log_levels(map_paths, games=5, seed=0, **game_kwargs):
+    '''
+    Plays the same seeded random games at every GPacGame log level and
+    returns the mean seconds per game for each level.
+    '''
+    results = dict()
+    for log_level in ['full', 'final', 'none']:
+        start = time.perf_counter()
+        for map_path in map_paths:
+            for game in range(games):
+                random.seed(seed+game)
+                fitness.play_GPac(None, game_map=map_path, log_level=log_level, **game_kwargs)
+        results[log_level] = (time.perf_counter() - start)/(games*len(map_paths))
+    return results
+
+def bench_replay_fps(map_paths, seed=0, frame_skip=1, redraw_frames=20, **game_kwargs):
+    '''
+    Renders one seeded random game per map headlessly and returns the frames
+    per second of the blitted ReplayRenderer next to redrawing a fresh
+    render_start figure for each frame (timed over the first redraw_frames).
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    results = list()
+    for map_path in map_paths:
+        random.seed(seed)
+        _, log = fitness.play_GPac(None, game_map=map_path, **game_kwargs)
+
+        start = time.perf_counter()
+        renderer = gpac.ReplayRenderer(log, frame_skip=frame_skip, headless=True)
+        canvas = renderer.figure.canvas
+        canvas.draw()
+        background = canvas.copy_from_bbox(renderer.axes.bbox)
+        setup_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for turn in renderer.frames:
+            canvas.restore_region(background)
+            for artist in renderer.update(turn):
+                renderer.axes.draw_artist(artist)
+            canvas.blit(renderer.axes.bbox)
+        blit_fps = len(renderer.frames)/(time.perf_counter() - start)
+
+        # the per-frame cost of the old approach: a new figure per frame
+        lines = log.to_text()
+        turn_lines = len(log.players) + 1
+        header = len(lines) - (log.num_turns-1)*turn_lines - len(log.fruit_events)
+        start = time.perf_counter()
+        for _ in range(redraw_frames):
+            gpac.render_start(lines[:header])
+            plt.gcf().canvas.draw()
+            plt.close('all')
+        redraw_fps = redraw_frames/(time.perf_counter() - start)
+        results.append({'map': map_path, 'frames': len(renderer.frames), 'setup_s': setup_time, 'blit_fps': blit_fps, 'redraw_fps': redraw_fps})
+    return results
+
+SUITE_PHASES = ('reset', 'get_actions', 'get_observations', 'step', 'manage_fruit')
+
+def time_phases(game, totals):
+    '''replaces game's phase methods with wrappers that add [calls, seconds] to totals[phase]'''
+    def timed(phase, method):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = method(*args, **kwargs)
+            totals[phase][1] += time.perf_counter() - start
+            totals[phase][0] += 1
+            return result
+        return wrapper
+    for phase in SUITE_PHASES:
+        # instance attributes shadow the methods, so calls from inside step are timed too
+        setattr(game, phase, timed(phase, getattr(game, phase)))
+
+def bench_suite_case(map_path, seed=0, games=1, controller=None, **game_kwargs):
+    '''
+    Benchmarks one map and game configuration: per-call latency of every
+    GPacGame phase over seeded random games (step includes manage_fruit),
+    play_GPac games per second with controller, and the peak traced memory
+    of one play_GPac game.
+    '''
+    totals = {phase: [0, 0.0] for phase in SUITE_PHASES}
+    game_map = gpac.load_map(map_path)
+    for game_idx in range(games):
+        random.seed(seed+game_idx)
+        game = gpac.GPacGame(game_map, **game_kwargs)
+        time_phases(game, totals)
+        game.reset()
+        while not game.gameover:
+            for player in game.players:
+                actions = game.get_actions(player)
+                game.get_observations(actions, player)
+                game.register_action(random.choice(actions), player)
+            game.step()
+
+    start = time.perf_counter()
+    for game_idx in range(games):
+        random.seed(seed+game_idx)
+        fitness.play_GPac(controller, game_map=game_map, **game_kwargs)
+    games_per_s = games/(time.perf_counter() - start)
+
+    random.seed(seed)
+    tracemalloc.start()
+    fitness.play_GPac(controller, game_map=game_map, **game_kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'phases': {phase: {'calls': calls, 'mean_us': 1e6*seconds/max(1, calls)} for phase, (calls, seconds) in totals.items()},
+            'games_per_s': games_per_s, 'peak_kib': peak/1024}
+
+def bench_suite(map_paths, pill_spawns=('stochastic', 'linear', 'manhattan'), players=((3, 1), (1, 1), (4, 2)), seed=0, games=1, depth=5, **game_kwargs):
+    '''
+    Runs bench_suite_case over every map, pill_spawn strategy and
+    (num_ghosts, num_pacs) setting. Pac-Man is played by one fixed random
+    tree of the given depth so controller evaluation is part of play_GPac.
+    Returns a JSON-serializable list of cases.
+    '''
+    random.seed(seed)
+    controller = TreeGenotype.initialization(1, depth_limit=depth)[0]
+    results = list()
+    for pill_spawn in pill_spawns:
+        for num_ghosts, num_pacs in players:
+            for map_path in map_paths:
+                case = {'map': map_path, 'pill_spawn': pill_spawn, 'num_ghosts': num_ghosts, 'num_pacs': num_pacs}
+                case.update(bench_suite_case(map_path, seed=seed, games=games, controller=controller, pill_spawn=pill_spawn,
+                                             num_ghosts=num_ghosts, num_pacs=num_pacs, **game_kwargs))
+                results.append(case)
+    return results
+
+def summarize_suite(results):
+    '''means over maps of every suite metric, keyed by "pill_spawn num_ghostsxnum_pacs"'''
+    groups = dict()
+    for case in results:
+        groups.setdefault(f'{case["pill_spawn"]} {case["num_ghosts"]}x{case["num_pacs"]}', list()).append(case)
+    summary = dict()
+    for key, cases in groups.items():
+        summary[key] = {phase: sum(case['phases'][phase]['mean_us'] for case in cases)/len(cases) for phase in SUITE_PHASES}
+        summary[key]['games_per_s'] = sum(case['games_per_s'] for case in cases)/len(cases)
+        summary[key]['peak_kib'] = max(case['peak_kib'] for case in cases)
+    return summary
+
+def random_rollout(game, depth):
+    '''plays up to depth turns of random actions for every player'''
+    for _ in range(depth):
+        if game.gameover:
+            break
+        for player in game.players:
+            game.register_action(random.choice(game.get_actions(player)), player)
+        game.step()
+    return game.score
+
+def bench_clones(map_path, seed=0, warmup_turns=100, copies=2000, rollouts=200, depth=20, **game_kwargs):
+    '''
+    Copies of a mid-game GPacGame per second by deepcopy, clone and
+    snapshot/restore, and random rollouts of depth turns per second from
+    that state using each copying strategy.
+    '''
+    random.seed(seed)
+    game = gpac.GPacGame(gpac.load_map(map_path), **game_kwargs)
+    random_rollout(game, warmup_turns)
+    game.nearest_pill_distance(game.players['m']) # build the distance fields, as sensing controllers do
+    results = {'map': map_path}
+
+    deep_copies = max(1, copies//20)
+    start = time.perf_counter()
+    for _ in range(deep_copies):
+        copy.deepcopy(game)
+    results['deepcopy_per_s'] = deep_copies/(time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(copies):
+        game.clone()
+    results['clone_per_s'] = copies/(time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(copies):
+        game.restore(game.snapshot())
+    results['snapshot_restore_per_s'] = copies/(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(max(1, rollouts//20)):
+        random_rollout(copy.deepcopy(game), depth)
+    results['deepcopy_rollouts_per_s'] = max(1, rollouts//20)/(time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(rollouts):
+        random_rollout(game.clone(), depth)
+    results['clone_rollouts_per_s'] = rollouts/(time.perf_counter() - start)
+    snapshot = game.snapshot(capture_rng=False)
+    start = time.perf_counter()
+    for _ in range(rollouts):
+        random_rollout(game, depth)
+        game.restore(snapshot)
+    results['restore_rollouts_per_s'] = rollouts/(time.perf_counter() - start)
+    return results
+
+class Scored():
+    def __init__(self, fitness):
+        self.fitness = fitness
+
+def naive_tournaments(population, n, k):
+    '''list-of-objects k-tournaments with replacement, for comparison'''
+    return [max(random.choices(population, k=k), key=lambda individual: individual.fitness) for _ in range(n)]
+
+def naive_fitness_proportionate(population, n):
+    '''list-of-objects roulette wheel, for comparison'''
+    low = min(individual.fitness for individual in population)
+    weights = [individual.fitness - min(low, 0) for individual in population]
+    return random.choices(population, weights=weights, k=n)
+
+def bench_selection(population_size=100000, k=5, seed=0):
+    '''
+    Seconds per call of every selection operator choosing population_size
+    individuals (half for survival) from a population of that size with
+    negative and positive fitness, next to list-of-objects versions.
+    '''
+    random.seed(seed)
+    population = [Scored(random.gauss(-10, 20)) for _ in range(population_size)]
+    n = population_size
+    operators = {
+        'uniform_random_selection': lambda: selection.uniform_random_selection(population, n),
+        'k_tournament_with_replacement': lambda: selection.k_tournament_with_replacement(population, n, k),
+        'naive k-tournaments': lambda: naive_tournaments(population, n, k),
+        'fitness_proportionate_selection': lambda: selection.fitness_proportionate_selection(population, n),
+        'naive roulette wheel': lambda: naive_fitness_proportionate(population, n),
+        'stochastic_universal_sampling': lambda: selection.stochastic_universal_sampling(population, n),
+        'truncation': lambda: selection.truncation(population, n//2),
+        'naive truncation': lambda: sorted(population, key=lambda individual: individual.fitness, reverse=True)[:n//2],
+        'k_tournament_without_replacement': lambda: selection.k_tournament_without_replacement(population, n//2, k),
+    }
+    results = dict()
+    for name, operator in operators.items():
+        start = time.perf_counter()
+        selected = operator()
+        results[name] = time.perf_counter() - start
+        assert len(selected) in (n, n//2), f"ERROR: {name} SELECTED {len(selected)} INDIVIDUALS"
+    return results
+
+def pairwise_agreement(estimates, truth):
+    '''fraction of the pairs of individuals with different true fitness that estimates rank the same way'''
+    agree, pairs = 0.0, 0
+    for i in range(len(truth)):
+        for j in range(i+1, len(truth)):
+            if truth[i] != truth[j]:
+                pairs += 1
+                difference = (estimates[i] - estimates[j])*(truth[i] - truth[j])
+                agree += 1.0 if difference > 0 else 0.5 if difference == 0 else 0.0
+    return agree/pairs if pairs else 1.0
+
+def bench_crn(map_path, population=30, games=(1, 2, 4), truth_games=20, trials=10, depth=5, seed=0, workers=None, **fitness_kwargs):
+    '''
+    How well fitness from a few games ranks a random population, with
+    independent games per individual and with common random numbers. The
+    true ranking is the mean score over truth_games independent games;
+    the pairwise agreement of each estimate with it is averaged over trials
+    for every number of games in games.
+    '''
+    random.seed(seed)
+    trees = TreeGenotype.initialization(population, depth_limit=depth)
+    fitness_kwargs = dict(fitness_kwargs, game_map=map_path)
+    evaluations = lambda run, common: fitness.evaluate_population(trees, workers=workers, seed=f'{seed}:{run}', common_random_numbers=common, **fitness_kwargs)
+    truth_runs = [evaluations(f'truth{run}', False) for run in range(truth_games)]
+    truth = [sum(scores)/truth_games for scores in zip(*truth_runs)]
+    results = list()
+    for common in (False, True):
+        for num_games in games:
+            agreements = list()
+            for trial in range(trials):
+                runs = [evaluations(f'trial{trial}:{run}', common) for run in range(num_games)]
+                agreements.append(pairwise_agreement([sum(scores) for scores in zip(*runs)], truth))
+            results.append({'common_random_numbers': common, 'games': num_games, 'agreement': sum(agreements)/trials,
+                            'worst_agreement': min(agreements)})
+    return results
+
+def naive_collisions(players, old_locations, graveyard):
+    '''the Pac-Men a step kills, found by the pairwise scan step used before the occupancy grid'''
+    pacs = {player for player in players if 'm' in player}
+    ghosts = [player for player in players if player not in pacs]
+    dead = set()
+    for pac in pacs:
+        if pac in graveyard:
+            continue
+        if players[pac] in {players[ghost] for ghost in ghosts}:
+            dead.add(pac)
+            continue
+        for ghost in ghosts:
+            if players[pac] == old_locations[ghost] and old_locations[pac] == players[ghost]:
+                dead.add(pac)
+    return dead
+
+def bench_stress(game_map=None, size=500, ghosts=(100, 300, 1000), pacs=10, turns=50, seed=0, **game_kwargs):
+    '''
+    Plays turns turns of random agents with many ghosts (each count in
+    ghosts) and pacs Pac-Men on game_map, by default a procedurally generated
+    size x size maze, and returns the mean microseconds per step, per step
+    and player, and for the pairwise collision scan step used to make on the
+    same positions (which must find the same deaths).
+    '''
+    if game_map is None:
+        game_map = map_generator.generate_maze(size, size, rng=random.Random(seed))
+    compiled_map = fitness.prepare_fitness_kwargs({'game_map': game_map})['game_map']
+    results = list()
+    for num_ghosts in ghosts:
+        random.seed(seed)
+        setup_start = time.perf_counter()
+        game = gpac.GPacGame(compiled_map, num_ghosts=num_ghosts, num_pacs=pacs, log_level='none', **game_kwargs)
+        setup_time = time.perf_counter() - setup_start
+        step_time, naive_time, played = 0.0, 0.0, 0
+        for _ in range(turns):
+            if game.gameover:
+                break
+            for player in game.players:
+                if player not in game.graveyard:
+                    game.register_action(random.choice(game.get_actions(player)), player)
+            old_locations, graveyard = game.players, set(game.graveyard)
+            start = time.perf_counter()
+            game.step()
+            step_time += time.perf_counter() - start
+            start = time.perf_counter()
+            dead = naive_collisions(game.players, old_locations, graveyard)
+            naive_time += time.perf_counter() - start
+            assert dead == game.graveyard - graveyard, "ERROR: OCCUPANCY GRID AND PAIRWISE SCAN DISAGREE"
+            played += 1
+        players = num_ghosts + pacs
+        results.append({'ghosts': num_ghosts, 'pacs': pacs, 'open_cells': len(compiled_map.open_cells), 'turns': played, 'setup_s': setup_time,
+                        'step_us': 1e6*step_time/played, 'step_us_per_player': 1e6*step_time/(played*players),
+                        'pairwise_collisions_us': 1e6*naive_time/played})
+    return results
+
+# what importing gpac cost before rendering was split out: the engine and matplotlib
+STARTUP_IMPORTS = {'headless': ['fitness'], 'with rendering': ['fitness', 'gpac_render']}
+
+def import_modules(modules):
+    for module in modules:
+        __import__(module)
+
+def worker_pid(_):
+    return os.getpid()
+
+def bench_startup(repeats=5, workers=4):
+    '''
+    Seconds to import fitness in a fresh interpreter (median of repeats,
+    measured inside the process and as the whole process run) and to start
+    a spawn-method pool of workers that import it and answer one task each,
+    headless and with the rendering module (and so matplotlib) imported too.
+    '''
+    directory = os.path.dirname(os.path.abspath(__file__))
+    context = multiprocessing.get_context('spawn')
+    results = dict()
+    for name, modules in STARTUP_IMPORTS.items():
+        code = f'import time; start = time.perf_counter(); {"; ".join(f"import {module}" for module in modules)}; print(time.perf_counter() - start)'
+        import_times, process_times = list(), list()
+        for _ in range(repeats):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', code], cwd=directory, capture_output=True, text=True, check=True).stdout
+            process_times.append(time.perf_counter() - start)
+            import_times.append(float(output))
+        spawn_times = list()
+        for _ in range(repeats):
+            start = time.perf_counter()
+            with context.Pool(workers, initializer=import_modules, initargs=(modules,)) as pool:
+                pool.map(worker_pid, range(4*workers), chunksize=1)
+            spawn_times.append(time.perf_counter() - start)
+        results[name] = {'import_s': sorted(import_times)[repeats//2], 'process_s': sorted(process_times)[repeats//2],
+                         'pool_s': sorted(spawn_times)[repeats//2]}
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='GPac simulator benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    distance_parser = subparsers.add_parser('distance_fields', help='incremental distance fields vs brute-force scanning')
+    distance_parser.add_argument('--maps', nargs='+', default=sorted(glob.glob('maps/map*.txt')))
+    distance_parser.add_argument('--metric', choices=['manhattan', 'maze'], default='manhattan')
+    distance_parser.add_argument('--pill_density', type=float, default=0.1)
+    distance_parser.add_argument('--seed', type=int, default=0)
+
+    log_parser = subparsers.add_parser('log_levels', help='per-game time of full, final-state-only and no logging')
+    log_parser.add_argument('--maps', nargs='+', default=sorted(glob.glob('maps/map*.txt')))
+    log_parser.add_argument('--games', type=int, default=5)
+    log_parser.add_argument('--seed', type=int, default=0)
+
+    replay_parser = subparsers.add_parser('replay_fps', help='frames per second of the blitted replay renderer')
+    replay_parser.add_argument('--maps', nargs='+', default=sorted(glob.glob('maps/map*.txt')))
+    replay_parser.add_argument('--frame_skip', type=int, default=1)
+    replay_parser.add_argument('--seed', type=int, default=0)
+    replay_parser.add_argument('--save', default=None, help='also export the first map\'s replay to this file')
+
+    suite_parser = subparsers.add_parser('suite', help='per-phase latency, games/sec and peak memory over maps and game settings')
+    suite_parser.add_argument('--maps', nargs='+', default=sorted(glob.glob('maps/map*.txt')))
+    suite_parser.add_argument('--pill_spawn', nargs='+', choices=['stochastic', 'linear', 'manhattan'], default=['stochastic', 'linear', 'manhattan'])
+    suite_parser.add_argument('--players', nargs='+', default=['3x1', '1x1', '4x2'], help='num_ghostsxnum_pacs settings')
+    suite_parser.add_argument('--games', type=int, default=1, help='games per map and setting')
+    suite_parser.add_argument('--seed', type=int, default=0)
+    suite_parser.add_argument('--out', default=None, help='write the results to this JSON file')
+    suite_parser.add_argument('--compare', default=None, help='JSON file of an earlier run to compare against')
+
+    clone_parser = subparsers.add_parser('clones', help='game copies and random rollouts per second')
+    clone_parser.add_argument('--map', default='maps/map00.txt')
+    clone_parser.add_argument('--copies', type=int, default=2000)
+    clone_parser.add_argument('--rollouts', type=int, default=200)
+    clone_parser.add_argument('--depth', type=int, default=20)
+    clone_parser.add_argument('--seed', type=int, default=0)
+
+    selection_parser = subparsers.add_parser('selection', help='selection operators on a large population')
+    selection_parser.add_argument('--population', type=int, default=100000)
+    selection_parser.add_argument('--k', type=int, default=5)
+    selection_parser.add_argument('--seed', type=int, default=0)
+
+    startup_parser = subparsers.add_parser('startup', help='import time and worker pool spawn time, headless vs with rendering')
+    startup_parser.add_argument('--repeats', type=int, default=5)
+    startup_parser.add_argument('--workers', type=int, default=4)
+
+    crn_parser = subparsers.add_parser('crn', help='ranking accuracy of independent games vs common random numbers')
+    crn_parser.add_argument('--map', default='maps/map00.txt')
+    crn_parser.add_argument('--population', type=int, default=30)
+    crn_parser.add_argument('--games', type=int, nargs='+', default=[1, 2, 4], help='games per individual of the estimates')
+    crn_parser.add_argument('--truth_games', type=int, default=20, help='games per individual of the reference ranking')
+    crn_parser.add_argument('--trials', type=int, default=10)
+    crn_parser.add_argument('--depth', type=int, default=5)
+    crn_parser.add_argument('--workers', type=int, default=None)
+    crn_parser.add_argument('--seed', type=int, default=0)
+
+    stress_parser = subparsers.add_parser('stress', help='step time with hundreds of agents on a large procedural maze')
+    stress_parser.add_argument('--map', default=None, help='map file to use instead of a generated maze')
+    stress_parser.add_argument('--size', type=int, default=500, help='width and height of the generated maze')
+    stress_parser.add_argument('--ghosts', type=int, nargs='+', default=[100, 300, 1000])
+    stress_parser.add_argument('--pacs', type=int, default=10)
+    stress_parser.add_argument('--turns', type=int, default=50)
+    stress_parser.add_argument('--pill_density', type=float, default=0.05)
+    stress_parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+    if args.benchmark == 'distance_fields':
+        results = bench_distance_fields(args.maps, seed=args.seed, metric=args.metric, pill_density=args.pill_density)
+        lookups = sum(result['lookups'] for result in results)
+        brute_time = sum(result['brute_force_s'] for result in results)
+        field_time = sum(result['field_s'] for result in results)
+        print(f'{len(results)} maps, {lookups} lookups ({args.metric}, pill density {args.pill_density})')
+        print(f'brute force:    {1e6*brute_time/lookups:.2f} us/lookup')
+        print(f'distance field: {1e6*field_time/lookups:.2f} us/lookup (including incremental updates)')
+        print(f'speedup:        {brute_time/field_time:.1f}x')
+    elif args.benchmark == 'log_levels':
+        results = bench_log_levels(args.maps, games=args.games, seed=args.seed)
+        for log_level, seconds in results.items():
+            print(f'{log_level:>5}: {1e3*seconds:.2f} ms/game ({results["full"]/seconds:.2f}x vs full)')
+    elif args.benchmark == 'suite':
+        players = [tuple(int(count) for count in setting.split('x')) for setting in args.players]
+        results = bench_suite(args.maps, pill_spawns=args.pill_spawn, players=players, seed=args.seed, games=args.games)
+        summary = summarize_suite(results)
+        baseline = None
+        if args.compare:
+            with open(args.compare) as file:
+                baseline = json.load(file)['summary']
+        header = ''.join(f'{phase:>18}' for phase in SUITE_PHASES)
+        print(f'{"case":<22}{header}{"games/s":>10}{"peak KiB":>10}  (mean us/call over {len(args.maps)} maps)')
+        for key, metrics in summary.items():
+            row = ''.join(f'{metrics[phase]:>18.2f}' for phase in SUITE_PHASES)
+            print(f'{key:<22}{row}{metrics["games_per_s"]:>10.2f}{metrics["peak_kib"]:>10.0f}')
+            if baseline is not None and key in baseline:
+                ratios = ''.join(f'{baseline[key][phase]/metrics[phase] if metrics[phase] else 0:>17.2f}x' for phase in SUITE_PHASES)
+                print(f'{"  speedup vs baseline":<22}{ratios}{metrics["games_per_s"]/baseline[key]["games_per_s"]:>9.2f}x')
+        if args.out:
+            with open(args.out, 'w') as file:
+                json.dump({'args': vars(args), 'summary': summary, 'results': results}, file, indent=1)
+            print(f'wrote {args.out}')
+    elif args.benchmark == 'clones':
+        results = bench_clones(args.map, seed=args.seed, copies=args.copies, rollouts=args.rollouts, depth=args.depth)
+        print(f'{args.map}: copies/s deepcopy {results["deepcopy_per_s"]:.0f}, clone {results["clone_per_s"]:.0f}, '
+              f'snapshot+restore {results["snapshot_restore_per_s"]:.0f}')
+        print(f'{args.depth}-turn rollouts/s: deepcopy {results["deepcopy_rollouts_per_s"]:.0f}, clone {results["clone_rollouts_per_s"]:.0f}, '
+              f'restore {results["restore_rollouts_per_s"]:.0f}')
+    elif args.benchmark == 'selection':
+        results = bench_selection(args.population, k=args.k, seed=args.seed)
+        for name, seconds in results.items():
+            print(f'{name:<34}{1e3*seconds:>10.1f} ms')
+    elif args.benchmark == 'replay_fps':
+        results = bench_replay_fps(args.maps, seed=args.seed, frame_skip=args.frame_skip)
+        for result in results:
+            print(f'{result["map"]}: {result["frames"]} frames, setup {1e3*result["setup_s"]:.0f} ms, '
+                  f'blitted {result["blit_fps"]:.0f} fps, full redraw {result["redraw_fps"]:.1f} fps')
+        if args.save:
+            random.seed(args.seed)
+            _, log = fitness.play_GPac(None, game_map=args.maps[0])
+            gpac.ReplayRenderer(log, frame_skip=args.frame_skip, headless=True).save(args.save)
+            print(f'saved {args.save}')
+    elif args.benchmark == 'crn':
+        results = bench_crn(args.map, population=args.population, games=args.games, truth_games=args.truth_games,
+                            trials=args.trials, depth=args.depth, seed=args.seed, workers=args.workers)
+        print(f'{args.map}: pairwise ranking agreement with the mean of {args.truth_games} games, {args.population} random trees')
+        for result in results:
+            mode = 'common random numbers' if result['common_random_numbers'] else 'independent games'
+            print(f'{mode:<22} {result["games"]:>3} games: mean {result["agreement"]:.3f}, worst {result["worst_agreement"]:.3f}')
+    elif args.benchmark == 'stress':
+        results = bench_stress(args.map, size=args.size, ghosts=args.ghosts, pacs=args.pacs, turns=args.turns, seed=args.seed, pill_density=args.pill_density)
+        print(f'{args.map or f"generated {args.size}x{args.size} maze"}: {results[0]["open_cells"]} open cells, {args.pacs} Pac-Men')
+        for result in results:
+            print(f'{result["ghosts"]:>6} ghosts: setup {1e3*result["setup_s"]:.0f} ms, step {result["step_us"]:.0f} us '
+                  f'({result["step_us_per_player"]:.2f} us/player) over {result["turns"]} turns, '
+                  f'pairwise collision scan alone {result["pairwise_collisions_us"]:.0f} us')
+    elif args.benchmark == 'startup':
+        results = bench_startup(repeats=args.repeats, workers=args.workers)
+        for name, result in results.items():
+            print(f'{name:<15} import {1e3*result["import_s"]:>7.1f} ms, python process {1e3*result["process_s"]:>7.1f} ms, '
+                  f'{args.workers}-worker spawn pool {1e3*result["pool_s"]:>7.1f} ms')
+        headless, rendering = results['headless'], results['with rendering']
+        print(f'speedup: import {rendering["import_s"]/headless["import_s"]:.1f}x, pool {rendering["pool_s"]/headless["pool_s"]:.1f}x')
+
+if __name__ == '__main__':
+    main()
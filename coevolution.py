@@ -0,0 +1,232 @@
+import random
+import multiprocessing
+import numpy as np
+
+from fitness import WORKER_STATE, init_worker, map_key, play_GPac_batch, prepare_fitness_kwargs, task_seeds
+
+SAMPLINGS = ('all', 'k_random', 'hall_of_fame')
+
+
+class ResultsMatrix():
+    '''
+    Sparse memo of co-evolution games: maps (pac id, ghost id, map, seed) to
+    the Pac-Man score of that game. Ids are canonical tree hashes, so
+    equivalent trees share results and surviving individuals never replay a
+    matchup. One matrix belongs to one set of fitness kwargs. Counts hits
+    and misses (see stats).
+    '''
+    def __init__(self):
+        self.scores = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        if key in self.scores:
+            self.hits += 1
+            return self.scores[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, score):
+        self.scores[key] = score
+
+    def __contains__(self, key):
+        return key in self.scores
+
+    def __len__(self):
+        return len(self.scores)
+
+    def prune(self, pac_ids, ghost_ids):
+        '''drops every game of a Pac-Man or ghost not in pac_ids or ghost_ids and returns how many were dropped'''
+        pac_ids, ghost_ids = set(pac_ids), set(ghost_ids)
+        stale = [key for key in self.scores if key[0] not in pac_ids or key[1] not in ghost_ids]
+        for key in stale:
+            del self.scores[key]
+        return len(stale)
+
+    def to_array(self, pac_ids, ghost_ids):
+        '''dense (len(pac_ids), len(ghost_ids)) array of mean scores over every stored game of each pairing, nan if unplayed'''
+        rows = {pac_id: row for row, pac_id in enumerate(pac_ids)}
+        columns = {ghost_id: column for column, ghost_id in enumerate(ghost_ids)}
+        totals = np.zeros((len(pac_ids), len(ghost_ids)))
+        games = np.zeros((len(pac_ids), len(ghost_ids)))
+        for (pac_id, ghost_id, _, _), score in self.scores.items():
+            if pac_id in rows and ghost_id in columns:
+                totals[rows[pac_id], columns[ghost_id]] += score
+                games[rows[pac_id], columns[ghost_id]] += 1
+        with np.errstate(invalid='ignore'):
+            return totals/games
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.scores),
+                'hit_rate': self.hits/lookups if lookups else 0.0}
+
+def play_matchup_batch(batch):
+    '''
+    Worker task: plays (Pac-Man gene, ghost gene, seed) games on game_map in
+    lockstep with play_GPac_batch, each on the random streams of its seed
+    (see fitness.play_GPac), and returns their Pac-Man scores. Maps other
+    than the configured one are loaded once per worker.
+    '''
+    game_map, games = batch
+    maps = WORKER_STATE.setdefault('maps', dict())
+    if game_map not in maps:
+        maps[game_map] = prepare_fitness_kwargs(dict(WORKER_STATE['fitness_kwargs'], game_map=game_map))
+    fitness_kwargs = dict(maps[game_map])
+    compiled_map = fitness_kwargs.pop('game_map')
+    pac_genes, ghost_genes, seeds = zip(*games)
+    return play_GPac_batch(list(pac_genes), list(ghost_genes), game_map=compiled_map, seeds=list(seeds), streams=True, **fitness_kwargs).tolist()
+
+class MatchupScheduler():
+    '''
+    Pairs a Pac-Man and a ghost population for competitive co-evolution,
+    plays the pairings and derives both populations' fitness from the
+    results. sampling picks the pairings:
+        'all': every Pac-Man plays every ghost
+        'k_random': every individual plays k opponents drawn from the other population
+        'hall_of_fame': k_random plus every individual plays the hall of fame of the
+            other population, the best individual of each of the last
+            hall_of_fame_size evaluations
+
+    Every pairing plays games_per_matchup games on each of maps (the
+    configured game_map if None). Game seeds derive from seed and are shared
+    by all pairings, so opponents are compared on the same games. Results
+    are memoized in results (a ResultsMatrix) and only new pairings are
+    played, in batches of batch_size games on one map run on a worker pool.
+
+    Pac-Man fitness is the mean score over all games the individual played
+    in its pairings and ghost fitness is the negated mean score.
+    '''
+    def __init__(self, sampling='all', k=5, maps=None, games_per_matchup=1, hall_of_fame_size=10, seed=0, batch_size=32, prune=True, results=None):
+        assert sampling in SAMPLINGS, f"ERROR: UNRECOGNIZED MATCHUP SAMPLING {sampling} BUT EXPECTED {SAMPLINGS}"
+        assert k >= 1, "ERROR: EVERY INDIVIDUAL NEEDS AT LEAST ONE OPPONENT"
+        self.sampling = sampling
+        self.k = k
+        self.maps = maps
+        self.seeds = task_seeds(seed, range(games_per_matchup))
+        self.hall_of_fame_size = hall_of_fame_size
+        self.hall_of_fame = {'pac': list(), 'ghost': list()} # (canonical gene, canonical hash), oldest first
+        self.batch_size = batch_size
+        self.prune = prune
+        self.results = ResultsMatrix() if results is None else results
+
+    def pairings(self, num_pacs, num_ghosts):
+        '''sorted (Pac-Man index, ghost index) pairs between the current populations'''
+        if self.sampling == 'all':
+            return [(pac, ghost) for pac in range(num_pacs) for ghost in range(num_ghosts)]
+        pairs = set()
+        for pac in range(num_pacs):
+            pairs.update((pac, ghost) for ghost in random.sample(range(num_ghosts), min(self.k, num_ghosts)))
+        for ghost in range(num_ghosts):
+            pairs.update((pac, ghost) for pac in random.sample(range(num_pacs), min(self.k, num_pacs)))
+        return sorted(pairs)
+
+    def matchups(self, pacs, ghosts):
+        '''
+        Scheduled (Pac-Man, ghost) pairs of (canonical gene, canonical hash)
+        contestants, including hall of fame opponents, and the population
+        index (or None for hall of fame members) of each side.
+        '''
+        matchups = [(pacs[pac], ghosts[ghost], pac, ghost) for pac, ghost in self.pairings(len(pacs), len(ghosts))]
+        if self.sampling == 'hall_of_fame':
+            matchups += [(pac, ghost, idx, None) for idx, pac in enumerate(pacs) for ghost in self.hall_of_fame['ghost']]
+            matchups += [(pac, ghost, None, idx) for idx, ghost in enumerate(ghosts) for pac in self.hall_of_fame['pac']]
+        return matchups
+
+    def game_maps(self, fitness_kwargs):
+        return [fitness_kwargs.get('game_map')] if self.maps is None else list(self.maps)
+
+    def play(self, matchups, game_maps, workers=None, **fitness_kwargs):
+        '''plays every game of matchups missing from results and stores the scores'''
+        pending = dict() # map -> {key: (Pac-Man gene, ghost gene, seed)}
+        for game_map in game_maps:
+            key_map = map_key(game_map)
+            for (pac_gene, pac_id), (ghost_gene, ghost_id), _, _ in matchups:
+                for seed in self.seeds:
+                    key = (pac_id, ghost_id, key_map, seed)
+                    if key not in self.results and key not in pending.get(game_map, ()):
+                        self.results.misses += 1
+                        pending.setdefault(game_map, dict())[key] = (pac_gene, ghost_gene, seed)
+                    else:
+                        self.results.hits += 1
+        batches, keys = list(), list()
+        for game_map, games in pending.items():
+            games = list(games.items())
+            for start in range(0, len(games), self.batch_size):
+                batch = games[start:start+self.batch_size]
+                batches.append((game_map, [game for _, game in batch]))
+                keys.append([key for key, _ in batch])
+
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if workers <= 1 or len(batches) <= 1:
+            init_worker(fitness_kwargs, False)
+            WORKER_STATE.pop('maps', None)
+            outcomes = [play_matchup_batch(batch) for batch in batches]
+        else:
+            with multiprocessing.Pool(min(workers, len(batches)), initializer=init_worker, initargs=(fitness_kwargs, False)) as pool:
+                outcomes = pool.map(play_matchup_batch, batches)
+        for batch_keys, scores in zip(keys, outcomes):
+            for key, score in zip(batch_keys, scores):
+                self.results.put(key, score)
+
+    def update_hall_of_fame(self, side, contestant):
+        hall_of_fame = [member for member in self.hall_of_fame[side] if member[1] != contestant[1]]
+        self.hall_of_fame[side] = (hall_of_fame + [contestant])[-self.hall_of_fame_size:]
+
+    def __call__(self, pacs, ghosts, workers=None, **fitness_kwargs):
+        '''
+        Evaluates a Pac-Man and a ghost population (TreeGenotype lists)
+        against each other, sets the fitness of every individual and returns
+        (Pac-Man fitnesses, ghost fitnesses) in population order.
+        '''
+        pac_contestants = [individual.canonical() for individual in pacs]
+        ghost_contestants = [individual.canonical() for individual in ghosts]
+        if self.prune:
+            self.results.prune([pac_id for _, pac_id in pac_contestants + self.hall_of_fame['pac']],
+                               [ghost_id for _, ghost_id in ghost_contestants + self.hall_of_fame['ghost']])
+        matchups = self.matchups(pac_contestants, ghost_contestants)
+        game_maps = self.game_maps(fitness_kwargs)
+        self.play(matchups, game_maps, workers=workers, **fitness_kwargs)
+
+        pac_scores = [list() for _ in pacs]
+        ghost_scores = [list() for _ in ghosts]
+        map_keys = [map_key(game_map) for game_map in game_maps]
+        for (_, pac_id), (_, ghost_id), pac, ghost in matchups:
+            scores = [self.results.scores[pac_id, ghost_id, key_map, seed] for key_map in map_keys for seed in self.seeds]
+            if pac is not None:
+                pac_scores[pac].extend(scores)
+            if ghost is not None:
+                ghost_scores[ghost].extend(scores)
+        pac_fitnesses = [float(np.mean(scores)) for scores in pac_scores]
+        ghost_fitnesses = [-float(np.mean(scores)) for scores in ghost_scores]
+        for individual, fitness in zip(pacs, pac_fitnesses):
+            individual.fitness = fitness
+        for individual, fitness in zip(ghosts, ghost_fitnesses):
+            individual.fitness = fitness
+
+        self.update_hall_of_fame('pac', pac_contestants[int(np.argmax(pac_fitnesses))])
+        self.update_hall_of_fame('ghost', ghost_contestants[int(np.argmax(ghost_fitnesses))])
+        return pac_fitnesses, ghost_fitnesses
+
+    def matrix(self, pacs, ghosts):
+        '''dense mean-score matrix of two populations from the stored results (see ResultsMatrix.to_array)'''
+        return self.results.to_array([individual.canonical_hash() for individual in pacs],
+                                     [individual.canonical_hash() for individual in ghosts])
+
+
+if __name__ == '__main__':
+    import time
+    from tree_genotype import TreeGenotype
+    random.seed(0)
+    fitness_kwargs = {'game_map': './maps/map00.txt', 'pill_spawn': 'linear', 'pill_density': 0.05, 'fruit_prob': 0.1, 'fruit_score': 10}
+    pacs = TreeGenotype.initialization(12, depth_limit=4)
+    ghosts = TreeGenotype.initialization(12, depth_limit=4)
+    for sampling in SAMPLINGS:
+        scheduler = MatchupScheduler(sampling, k=3, games_per_matchup=2)
+        for generation in range(2):
+            start = time.perf_counter()
+            pac_fitnesses, ghost_fitnesses = scheduler(pacs, ghosts, workers=2, **fitness_kwargs)
+            print(f'{sampling} evaluation {generation}: best Pac-Man {max(pac_fitnesses):.1f}, best ghost {max(ghost_fitnesses):.1f}, '
+                  f'{time.perf_counter() - start:.2f}s, {scheduler.results.stats()}')
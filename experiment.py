@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+
+# use: python3 experiment.py configs/green2a_config.txt [--runs 30] [--evaluations 2000] [--results data/randomSearchResults.txt]
+# use note: rerunning the same command resumes interrupted runs from their checkpoints
+
+import os
+import argparse
+import hashlib
+import multiprocessing
+import random
+import numpy as np
+
+from snake_eyes import read_config
+from fitness import evaluate_population, task_seeds
+from tree_genotype import TreeGenotype, pack_genes, unpack_genes
+
+
+def save_checkpoint(filename, state):
+    '''writes state (a dict of arrays) to filename atomically, so an interrupted write never replaces a good checkpoint'''
+    temporary = f'{filename}.{os.getpid()}.tmp.npz'
+    np.savez_compressed(temporary, **state)
+    os.replace(temporary, filename)
+
+def load_checkpoint(filename):
+    with np.load(filename) as checkpoint:
+        return {key: checkpoint[key] for key in checkpoint.files}
+
+def pack_rng_state(state):
+    '''random.getstate() as arrays: (version, 624 Mersenne Twister words and position, gauss_next or nan)'''
+    version, internal_state, gauss_next = state
+    return {'rng_version': np.array(version), 'rng_state': np.array(internal_state, dtype=np.uint32),
+            'rng_gauss': np.array(np.nan if gauss_next is None else gauss_next)}
+
+def unpack_rng_state(checkpoint):
+    gauss_next = float(checkpoint['rng_gauss'])
+    return (int(checkpoint['rng_version']), tuple(checkpoint['rng_state'].tolist()), None if np.isnan(gauss_next) else gauss_next)
+
+def run_random_search(run, seed, evaluations, config_path, checkpoint_dir, checkpoint_every=100):
+    '''
+    One random search run, as in the notebook: a ramped half-and-half
+    population of size evaluations is generated from seed and evaluated in
+    chunks of checkpoint_every. After every chunk, the population, its
+    fitness so far, the random module state and the best-so-far are
+    checkpointed, and an interrupted run continues from its last checkpoint
+    with identical results. Returns (best fitness, best tree text).
+    '''
+    config = read_config(config_path, globalVars=globals(), localVars=locals())
+    checkpoint_path = os.path.join(checkpoint_dir, f'run{run:03d}.npz')
+    # identifies the settings a checkpoint belongs to
+    with open(config_path, 'rb') as file:
+        settings = hashlib.blake2b(file.read() + f'{seed}:{evaluations}'.encode(), digest_size=16).hexdigest()
+
+    if os.path.exists(checkpoint_path):
+        checkpoint = load_checkpoint(checkpoint_path)
+        assert str(checkpoint['settings']) == settings, f"ERROR: CHECKPOINT {checkpoint_path} WAS WRITTEN WITH DIFFERENT SETTINGS"
+        population = [TreeGenotype() for _ in checkpoint['gene_lengths']]
+        for individual, gene in zip(population, unpack_genes(checkpoint)):
+            individual.gene = gene
+        fitnesses = checkpoint['fitnesses'].tolist()
+        random.setstate(unpack_rng_state(checkpoint))
+    else:
+        random.seed(seed)
+        population = TreeGenotype.initialization(evaluations, **config['initialization_kwargs'])
+        fitnesses = list()
+
+    while len(fitnesses) < len(population):
+        chunk = population[len(fitnesses):len(fitnesses)+checkpoint_every]
+        fitnesses.extend(evaluate_population(chunk, workers=1, seed=seed, **config['fitness_kwargs']))
+        best = int(np.argmax(fitnesses))
+        state = pack_genes([individual.gene for individual in population])
+        state.update(pack_rng_state(random.getstate()))
+        state.update({'settings': np.array(settings), 'fitnesses': np.array(fitnesses, dtype=float),
+                      'best_index': np.array(best), 'best_fitness': np.array(fitnesses[best], dtype=float),
+                      'best_tree': np.array(population[best].print())})
+        save_checkpoint(checkpoint_path, state)
+
+    best = int(np.argmax(fitnesses))
+    return fitnesses[best], population[best].print()
+
+def run_task(task):
+    return run_random_search(*task)
+
+def format_value(value):
+    '''one value as written to results files like data/mysteryAlgorithmResults.txt'''
+    return f'{int(value)}' if float(value).is_integer() else f'{value}'
+
+def main():
+    parser = argparse.ArgumentParser(description='parallel multi-run random search experiments with checkpoint/resume')
+    parser.add_argument('config')
+    parser.add_argument('--runs', type=int, default=30)
+    parser.add_argument('--evaluations', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0, help='base seed; every run gets a distinct seed derived from it')
+    parser.add_argument('--workers', type=int, default=None, help='parallel runs (all cores by default)')
+    parser.add_argument('--checkpoint_every', type=int, default=100, help='evaluations between checkpoints')
+    parser.add_argument('--checkpoint_dir', default=None, help='defaults to checkpoints/<config name>')
+    parser.add_argument('--results', default=None, help='best fitness of each run, one per line (defaults to data/<config name>_results.txt)')
+    parser.add_argument('--solution', default=None, help='write the best tree over all runs to this file')
+    args = parser.parse_args()
+
+    name = os.path.splitext(os.path.basename(args.config))[0]
+    checkpoint_dir = args.checkpoint_dir or os.path.join('checkpoints', name)
+    results_path = args.results or os.path.join('data', f'{name}_results.txt')
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    seeds = task_seeds(args.seed, range(args.runs))
+    tasks = [(run, seed, args.evaluations, args.config, checkpoint_dir, args.checkpoint_every) for run, seed in enumerate(seeds)]
+
+    workers = min(args.runs, args.workers or multiprocessing.cpu_count())
+    best_fitness, best_tree = None, None
+    with open(results_path, 'w') as results, multiprocessing.Pool(workers) as pool:
+        # results are streamed in run order as runs finish (finished runs resume instantly)
+        for run, (fitness, tree) in enumerate(pool.imap(run_task, tasks)):
+            results.write(f'{format_value(fitness)}\n')
+            results.flush()
+            print(f'run {run}: best fitness {format_value(fitness)}')
+            if best_fitness is None or fitness > best_fitness:
+                best_fitness, best_tree = fitness, tree
+    print(f'best fitness over {args.runs} runs: {format_value(best_fitness)} (results in {results_path})')
+    if args.solution:
+        with open(args.solution, 'w') as file:
+            file.write(best_tree)
+
+if __name__ == '__main__':
+    main()
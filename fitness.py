@@ -1,39 +1,90 @@
+import os
+import glob
 import time
-from collections import deque
+import cProfile
+import hashlib
+from collections import deque, OrderedDict
 import gpac
 import random
 import statistics
+import multiprocessing
+import numpy as np
+from gpac import parse_map # re-exported for existing callers
+from tree_genotype import compile_gene
+from game_stats import GameStats, player_type
 
 
 def manhattan_distance(location0, location1):
     '''calculate the Manhattan distance between two input points'''
     return sum([abs(coord[0] - coord[1]) for coord in zip(list(location0), list(location1))]) # overkill
 
-def parse_map(filename):
-    game_map = list()
-    with open(filename) as file:
-        line = file.readline()
-        line = line.rstrip('\n').split(' ')
-        width, height = int(line[0]), int(line[1])
-        game_map = [[None for y in range(height)] for x in range(width)]
-        y = -1
-        while line := file.readline():
-            for x, char in enumerate(line):
-                if char == '~':
-                    game_map[x][y] = 0
-                elif char == '#':
-                    game_map[x][y] = 1
-            y -= 1
-    return game_map
+def maze_distance(game_map, location0, location1):
+    '''look up the shortest path distance between two open cells of a gpac.CompiledMap'''
+    return game_map.maze_distance(location0, location1)
 
-def play_GPac(pac_controller, ghost_controller=None, game_map=None, **kwargs):
+def sense(game, s_primes, player='m'):
     '''
-    Fitness function that plays a game using the provided pac_controller
-    with optional ghost controller and game map specifications.
+    Returns one (G, P, W, F) sensor row per state in s_primes as seen by
+    player: the distance to the nearest ghost, pill and fruit (gpac.UNREACHABLE
+    when there is none) under the game's distance_metric, and the number of
+    walls (including map borders) adjacent to the player.
+    '''
+    compiled_map = game.compiled_map
+    if game.distance_metric == 'maze':
+        distance = compiled_map.maze_distance
+    else:
+        distance = manhattan_distance
+    ghosts = [game.players[ghost] for ghost in game.ghost_players]
+    sensors = list()
+    for s_prime in s_primes:
+        location = s_prime['players'][player]
+        sensors.append((float(min([distance(location, ghost) for ghost in ghosts], default=gpac.UNREACHABLE)),
+                        float(game.nearest_pill_distance(location)),
+                        float(len(gpac.GHOST_ACTIONS) - len(compiled_map.ghost_moves[location])),
+                        float(game.nearest_fruit_distance(location))))
+    return sensors
+
+def sense_ghost(game, s_primes, player):
+    '''
+    Returns one (G, P, W, F) sensor row per state in s_primes as seen by
+    ghost player: the distance to the nearest other ghost and to the
+    nearest living Pac-Man (gpac.UNREACHABLE when there is none) under the
+    game's distance_metric, the number of walls (including map borders)
+    adjacent to the ghost and the distance to the fruit.
+    '''
+    compiled_map = game.compiled_map
+    if game.distance_metric == 'maze':
+        distance = compiled_map.maze_distance
+    else:
+        distance = manhattan_distance
+    pacs = [game.players[pac] for pac in game.pac_players if pac not in game.graveyard]
+    ghosts = [game.players[ghost] for ghost in game.ghost_players if ghost != player]
+    sensors = list()
+    for s_prime in s_primes:
+        location = s_prime['players'][player]
+        sensors.append((float(min([distance(location, ghost) for ghost in ghosts], default=gpac.UNREACHABLE)),
+                        float(min([distance(location, pac) for pac in pacs], default=gpac.UNREACHABLE)),
+                        float(len(gpac.GHOST_ACTIONS) - len(compiled_map.ghost_moves[location])),
+                        float(game.nearest_fruit_distance(location))))
+    return sensors
 
-    Returns Pac-Man score from a full game as well as the game log.
+def get_evaluator(controller):
     '''
+    Returns a function that scores a batch of sensor rows for a controller
+    given as a TreeGenotype, a bare gene, or such a function itself.
+    '''
+    if hasattr(controller, 'compile'):
+        return controller.compile()
+    if callable(controller):
+        return controller
+    return compile_gene(controller)
 
+def load_game_map(game_map=None):
+    '''
+    Returns a playable game map from a map file path (as a memoized
+    gpac.CompiledMap), an existing map or CompiledMap, or None for the
+    default generic map.
+    '''
     # default generic game map
     if game_map is None:
         size = 21
@@ -45,46 +96,530 @@ def play_GPac(pac_controller, ghost_controller=None, game_map=None, **kwargs):
             game_map[i][size//2] = 0
             game_map[-1][i] = 0
             game_map[i][-1] = 0
-    # parse game map from file
+    # load compiled game map from file
     elif isinstance(game_map, str):
-        game_map = parse_map(game_map)
+        game_map = gpac.load_map(game_map)
     # assume you've passed an acceptable game map
     else:
         pass
-    game = gpac.GPacGame(game_map, **kwargs)
+    return game_map
+
+def play_GPac(pac_controller, ghost_controller=None, game_map=None, stats=None, profile=False, **kwargs):
+    '''
+    Fitness function that plays a game using the provided pac_controller
+    with optional ghost controller and game map specifications.
+
+    Returns Pac-Man score from a full game as well as the game log (None
+    with log_level='none', see gpac.GPacGame).
+
+    With seed, the game and its players draw from independent random
+    streams derived from it (see gpac.rng_streams) instead of the global
+    random module, so the game only depends on the seed and the controllers.
+
+    With stats (True or a game_stats.GameStats to add to), the game is
+    instrumented (see GPacGame.instrument), sensing and controller time is
+    recorded per player type, and (score, log, stats) is returned. With
+    profile, the game loop also runs under cProfile into stats.profile.
+    '''
+    if stats is True or (profile and stats is None):
+        stats = GameStats()
+    game_map = load_game_map(game_map)
+    game = gpac.GPacGame(game_map, stats=stats, **kwargs)
+    if pac_controller is not None:
+        pac_evaluator = get_evaluator(pac_controller)
+    if ghost_controller is not None:
+        ghost_evaluator = get_evaluator(ghost_controller)
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
     
     # game loop
     while not game.gameover:
         for player in game.players:
             actions = game.get_actions(player)
             s_primes = game.get_observations(actions, player)
+            if stats is not None:
+                start = time.perf_counter()
             selected_action_idx = None
             # select ghost actions using provided strategy
-            if 'm' not in player:
+            if not game.is_pac[player]:
                 if ghost_controller is None:
                     # provided random ghost controller
-                    selected_action_idx = random.choice(range(len(actions)))
+                    selected_action_idx = game.rng('ghosts').choice(range(len(actions)))
                 else:
-                    # 2c TODO: add logic to use ghost controllers in competitive co-evolution
-                    pass
+                    # every ghost is played by the ghost controller, greedily on its sensors (see sense_ghost)
+                    scores = ghost_evaluator(sense_ghost(game, s_primes, player), game.rng('ghosts'))
+                    selected_action_idx = max(range(len(scores)), key=scores.__getitem__)
             
             # select Pac-Man action(s) using provided strategy 
             else:
                 if pac_controller is None:
                     # random pac-man controller for demo purposes
-                    selected_action_idx = random.choice(range(len(actions)))
+                    selected_action_idx = game.rng('pacs').choice(range(len(actions)))
                 else:
-                    # YOUR 2A CODE GOES HERE###############################################
-                    # 2a TODO: score states stored in s_prime
-                    pass
-                    
-                    # 2a TODO: assign index of state with the best score to selected_action_idx
-                    pass
-                    
-                    # YOUR CODE (PROBABLY) ENDS HERE#######################################
+                    # score states stored in s_prime
+                    if stats is None:
+                        scores = pac_evaluator(sense(game, s_primes, player), game.rng('pacs'))
+                    else:
+                        sensors = sense(game, s_primes, player)
+                        stats.add_time('sense', 'pac', time.perf_counter() - start)
+                        start = time.perf_counter()
+                        scores = pac_evaluator(sensors, game.rng('pacs'))
+
+                    # greedy policy: assign index of state with the best score to selected_action_idx
+                    selected_action_idx = max(range(len(scores)), key=scores.__getitem__)
             # print(selected_action_idx)
             # print(actions)
+            if stats is not None:
+                stats.add_time('controller', player_type(player), time.perf_counter() - start)
             game.register_action(actions[selected_action_idx], player)
         
         game.step()
-    return game.score, game.log
\ No newline at end of file
+    if profile:
+        profiler.disable()
+        stats.add_profile(profiler)
+    if stats is not None:
+        return game.score, game.log, stats
+    return game.score, game.log
+
+def prepare_fitness_kwargs(fitness_kwargs):
+    '''
+    Returns a copy of fitness_kwargs with game_map loaded as a
+    gpac.CompiledMap (and its distance table mapped if sensors need it), so
+    repeated play_GPac calls skip all map setup.
+    '''
+    fitness_kwargs = dict(fitness_kwargs)
+    game_map = load_game_map(fitness_kwargs.get('game_map'))
+    if not isinstance(game_map, gpac.CompiledMap):
+        game_map = gpac.CompiledMap(game_map)
+    if fitness_kwargs.get('distance_metric') == 'maze':
+        game_map.distances
+    fitness_kwargs['game_map'] = game_map
+    return fitness_kwargs
+
+def task_seeds(seed, keys):
+    '''
+    Per-task seeds derived from seed (drawn from the global random module if
+    None) and each task's key, so equal keys always get equal seeds.
+    '''
+    if seed is None:
+        seed = random.getrandbits(64)
+    return [int.from_bytes(hashlib.blake2b(f'{seed}:{key}'.encode(), digest_size=8).digest(), 'big') for key in keys]
+
+def individual_seeds(seed, canonical_hashes, common_random_numbers=False):
+    '''
+    Game seeds of individuals with the given canonical hashes: derived from
+    seed and each hash, or one seed derived from seed shared by all with
+    common_random_numbers (see evaluate_population).
+    '''
+    if common_random_numbers:
+        return task_seeds(seed, ['common random numbers'])*len(canonical_hashes)
+    return task_seeds(seed, canonical_hashes)
+
+def map_key(game_map):
+    '''hashable identity of a game map argument for FitnessCache keys'''
+    if game_map is None:
+        return None
+    if isinstance(game_map, str):
+        return os.path.abspath(game_map)
+    if not isinstance(game_map, gpac.CompiledMap):
+        game_map = gpac.CompiledMap(game_map)
+    if game_map.source is not None:
+        return game_map.source
+    return hashlib.blake2b(game_map.cells.tobytes() + bytes(game_map.cells.shape), digest_size=16).hexdigest()
+
+class FitnessCache():
+    '''
+    Bounded cache of evaluation results keyed by (canonical tree hash, game
+    map, other fitness kwargs, seed). The least recently used entry is
+    evicted once maxsize entries are stored. Counts hits, misses and
+    evictions (see stats).
+    '''
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(canonical_hash, seed, **fitness_kwargs):
+        settings = tuple(sorted((key, repr(value)) for key, value in fitness_kwargs.items() if key != 'game_map'))
+        return (canonical_hash, map_key(fitness_kwargs.get('game_map')), settings, seed)
+
+    def get(self, key, default=None):
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self.entries),
+                'hit_rate': self.hits/lookups if lookups else 0.0}
+
+def evaluate_gene(gene, seed, fitness_kwargs, return_log=False, return_stats=False):
+    '''
+    Plays one game with gene as the Pac-Man controller on the random
+    streams of seed (see play_GPac), leaving the global random module
+    untouched. Unless fitness_kwargs sets a log_level, the game is only
+    logged if return_log. With return_stats, the result is paired with the
+    game's GameStats.
+    '''
+    fitness_kwargs = dict(fitness_kwargs, seed=seed)
+    fitness_kwargs.setdefault('log_level', 'full' if return_log else 'none')
+    if return_stats:
+        score, log, stats = play_GPac(gene, stats=True, **fitness_kwargs)
+    else:
+        score, log = play_GPac(gene, **fitness_kwargs)
+    result = (score, log) if return_log else score
+    return (result, stats) if return_stats else result
+
+def evaluation_seed(individual, seed, common_random_numbers=False):
+    '''seed that evaluate_population(..., seed=seed, common_random_numbers=common_random_numbers) plays individual with'''
+    return individual_seeds(seed, [individual.canonical_hash()], common_random_numbers)[0]
+
+def replay_GPac(pac_controller, seed, **fitness_kwargs):
+    '''
+    Replays the game a controller played with the given seed (see
+    evaluation_seed) with full logging, e.g. to regenerate the log of the
+    best individual of a score-only evaluation. Returns (score, log).
+    '''
+    fitness_kwargs['log_level'] = 'full'
+    return evaluate_gene(pac_controller, seed, fitness_kwargs, return_log=True)
+
+# per-process state installed by init_worker
+WORKER_STATE = dict()
+
+def init_worker(fitness_kwargs, return_log, return_stats=False):
+    WORKER_STATE['fitness_kwargs'] = prepare_fitness_kwargs(fitness_kwargs)
+    WORKER_STATE['return_log'] = return_log
+    WORKER_STATE['return_stats'] = return_stats
+
+def evaluate_task(task):
+    gene, seed, overrides = task
+    fitness_kwargs = WORKER_STATE['fitness_kwargs']
+    if overrides:
+        fitness_kwargs = prepare_fitness_kwargs(dict(fitness_kwargs, **overrides))
+    return evaluate_gene(gene, seed, fitness_kwargs, WORKER_STATE['return_log'], WORKER_STATE['return_stats'])
+
+def evaluate_tasks(tasks, workers=None, return_log=False, chunksize=None, cache=None, stats=None, **fitness_kwargs):
+    '''
+    Plays every (canonical gene, canonical hash, seed, overrides) task and
+    returns the outcomes in task order (see evaluate_population). overrides
+    is a dict of fitness kwargs for that task only, e.g. another game_map
+    path, which workers load once and keep cached.
+    '''
+    results = [None]*len(tasks)
+    pending = dict() # task key -> (gene, seed, overrides, indices of tasks awaiting the result)
+    for idx, (gene, canonical_hash, task_seed, overrides) in enumerate(tasks):
+        key = FitnessCache.make_key(canonical_hash, task_seed, return_log=return_log, **dict(fitness_kwargs, **overrides))
+        if key in pending:
+            pending[key][3].append(idx)
+            continue
+        outcome = None if cache is None else cache.get(key)
+        if outcome is None:
+            pending[key] = (gene, task_seed, overrides, [idx])
+        else:
+            results[idx] = outcome
+    runs = [(gene, task_seed, overrides) for gene, task_seed, overrides, _ in pending.values()]
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers <= 1 or len(runs) <= 1:
+        init_worker(fitness_kwargs, return_log, stats is not None)
+        outcomes = [evaluate_task(run) for run in runs]
+    else:
+        if chunksize is None:
+            chunksize = max(1, len(runs)//(4*workers))
+        with multiprocessing.Pool(workers, initializer=init_worker, initargs=(fitness_kwargs, return_log, stats is not None)) as pool:
+            outcomes = pool.map(evaluate_task, runs, chunksize=chunksize)
+    if stats is not None:
+        for _, task_stats in outcomes:
+            stats.merge(task_stats)
+        outcomes = [outcome for outcome, _ in outcomes]
+
+    for (key, (_, _, _, indices)), outcome in zip(pending.items(), outcomes):
+        if cache is not None:
+            cache.put(key, outcome)
+        for idx in indices:
+            results[idx] = outcome
+    return results
+
+def evaluate_population(population, workers=None, seed=None, return_log=False, chunksize=None, cache=None, stats=None, common_random_numbers=False, **fitness_kwargs):
+    '''
+    Evaluates every individual of population with play_GPac using a pool of
+    workers processes (all cores if None; in this process if 1). Each worker
+    loads and compiles the configured map once; only canonical genes and
+    seeds are sent per task. Every individual plays on random streams
+    seeded from seed and its canonical hash, so parallel and serial runs
+    give identical results and equivalent trees play identical games.
+
+    With common_random_numbers, every individual plays with the same seed
+    instead: the same pill layout, the same fruit rolls and, with random
+    ghosts, the same ghost moves, as the streams are independent of the
+    Pac-Man's own draws. Score differences then come from the controllers
+    rather than the draw, so fewer games rank individuals as reliably. With
+    seed None (a new seed per call) every generation still faces new games.
+
+    With a FitnessCache, cached results are reused and equivalent trees are
+    only played once.
+
+    With stats (a game_stats.GameStats), the instrumentation of every game
+    played (cache hits are not replayed) is added to it.
+
+    Returns scores, or (score, log) pairs with return_log, in population order.
+    '''
+    canonical = [individual.canonical() for individual in population]
+    seeds = individual_seeds(seed, [canonical_hash for _, canonical_hash in canonical], common_random_numbers)
+    tasks = [(gene, canonical_hash, task_seed, dict()) for (gene, canonical_hash), task_seed in zip(canonical, seeds)]
+    return evaluate_tasks(tasks, workers=workers, return_log=return_log, chunksize=chunksize, cache=cache, stats=stats, **fitness_kwargs)
+
+class RacingEvaluator():
+    '''
+    Multi-fidelity successive-halving evaluation over a set of maps.
+
+    Every individual is first played at the lowest fidelity; the best
+    1/halving_rate of them are promoted to halving_rate times the fidelity,
+    and so on until the survivors are played at full fidelity. With
+    fidelity='maps', min_resource is the number of maps of the first rung
+    and promoted individuals play additional maps (earlier games are kept),
+    up to num_maps. With fidelity='turns', every rung plays all num_maps
+    maps, stopped early after a min_resource fraction of the game's time at
+    first (see GPacGame's horizon; time and the clear bonus are the full
+    game's, so truncated games are prefixes of full ones).
+
+    maps are the candidate map paths (all of maps/ by default) and sampling
+    picks the num_maps maps used by one call: 'fixed' (the first num_maps),
+    'random' (drawn from seed) or 'cycle' (the next num_maps each call).
+    All individuals of a call play the same maps, and with
+    common_random_numbers also the same game on each map (see
+    evaluate_population). With a budget (in full-game equivalents), the
+    largest min_resource that fits is used.
+
+    A call returns the fitness of every individual in population order,
+    like evaluate_population. Fitness orders by rung reached first: it is
+    the mean score over the games played at the individual's last rung,
+    lowered where needed so every individual eliminated at a rung ranks
+    below every individual promoted past it (order within a rung is kept).
+    One lucky game therefore never lifts an eliminated individual above
+    those that survived more games. The details are kept in results (rung
+    reached, maps, scores, mean score and fitness of each individual) and
+    best (index of the fittest individual of the last rung).
+    '''
+    def __init__(self, maps=None, num_maps=None, halving_rate=2, min_resource=1, fidelity='maps', sampling='fixed', budget=None, common_random_numbers=False):
+        fidelities = {'maps', 'turns'}
+        assert fidelity in fidelities, f"ERROR: UNRECOGNIZED RACING FIDELITY {fidelity} BUT EXPECTED {fidelities}"
+        sampling_policies = {'fixed', 'random', 'cycle'}
+        assert sampling in sampling_policies, f"ERROR: UNRECOGNIZED MAP SAMPLING POLICY {sampling} BUT EXPECTED {sampling_policies}"
+        assert halving_rate > 1, "ERROR: HALVING RATE MUST BE GREATER THAN 1"
+        self.maps = sorted(glob.glob('./maps/map*.txt')) if maps is None else list(maps)
+        assert len(self.maps) > 0, "ERROR: NO MAPS TO RACE ON"
+        self.num_maps = len(self.maps) if num_maps is None else min(num_maps, len(self.maps))
+        self.halving_rate = halving_rate
+        self.min_resource = min_resource
+        self.fidelity = fidelity
+        self.sampling = sampling
+        self.budget = budget
+        self.common_random_numbers = common_random_numbers
+        self.calls = 0
+        self.results = list()
+        self.best = None
+
+    def schedule(self, population_size, min_resource=None):
+        '''[(survivors, maps or time fraction)] of every rung'''
+        if min_resource is None:
+            min_resource = self.min_resource
+        full = self.num_maps if self.fidelity == 'maps' else 1.0
+        rungs = list()
+        survivors, resource = population_size, min(min_resource, full)
+        while True:
+            rungs.append((survivors, resource))
+            if resource >= full:
+                return rungs
+            survivors = max(1, -(-survivors//self.halving_rate))
+            resource = min(full, resource*self.halving_rate)
+
+    def cost(self, rungs):
+        '''full-game equivalents played by a schedule'''
+        if self.fidelity == 'maps':
+            return sum(survivors*(resource - previous) for (survivors, resource), previous in zip(rungs, [0] + [resource for _, resource in rungs]))
+        return sum(survivors*resource*self.num_maps for survivors, resource in rungs)
+
+    def fit_schedule(self, population_size):
+        if self.budget is None:
+            return self.schedule(population_size)
+        if self.fidelity == 'maps':
+            candidates = range(self.num_maps, 0, -1)
+        else:
+            candidates = [self.halving_rate**-power for power in range(0, 20)]
+        for min_resource in candidates:
+            rungs = self.schedule(population_size, min_resource)
+            if self.cost(rungs) <= self.budget:
+                return rungs
+        return rungs
+
+    def sample_maps(self, seed):
+        if self.sampling == 'fixed':
+            return self.maps[:self.num_maps]
+        if self.sampling == 'random':
+            return random.Random(seed).sample(self.maps, self.num_maps)
+        start = (self.calls*self.num_maps) % len(self.maps)
+        return [self.maps[(start + idx) % len(self.maps)] for idx in range(self.num_maps)]
+
+    def __call__(self, population, workers=None, seed=None, cache=None, stats=None, **fitness_kwargs):
+        if seed is None:
+            seed = random.getrandbits(64)
+        fitness_kwargs.pop('game_map', None)
+        maps = self.sample_maps(seed)
+        self.calls += 1
+        canonical = [individual.canonical() for individual in population]
+        scores = [dict() for _ in population] # map -> score of the games played at the current rung
+        reached = [0]*len(population)
+        alive = list(range(len(population)))
+        rungs = self.fit_schedule(len(population))
+        for rung, (survivors, resource) in enumerate(rungs):
+            # promote the best individuals of the previous rung
+            alive = sorted(alive, key=lambda idx: -statistics.mean(scores[idx].values()) if scores[idx] else 0)[:survivors]
+            if self.fidelity == 'maps':
+                rung_maps, overrides = maps[len(scores[alive[0]]):int(resource)], dict()
+            else:
+                rung_maps, overrides = maps, (dict() if resource >= 1 else {'horizon': resource})
+                for idx in alive:
+                    scores[idx] = dict()
+            tasks = list()
+            for map_path in rung_maps:
+                # the seed does not depend on the horizon, so truncated games are prefixes of full ones
+                seeds = individual_seeds(f'{seed}:{map_path}', [canonical[idx][1] for idx in alive], self.common_random_numbers)
+                tasks.extend((*canonical[idx], task_seed, dict(overrides, game_map=map_path)) for idx, task_seed in zip(alive, seeds))
+            outcomes = evaluate_tasks(tasks, workers=workers, cache=cache, stats=stats, **fitness_kwargs)
+            for (_, _, _, overrides), idx, score in zip(tasks, [idx for _ in rung_maps for idx in alive], outcomes):
+                scores[idx][overrides['game_map']] = score
+            for idx in alive:
+                reached[idx] = rung
+
+        means = [statistics.mean(individual_scores.values()) for individual_scores in scores]
+        fitnesses = list(means)
+        floor = None # lowest fitness of the individuals promoted past the current rung
+        for rung in range(len(rungs)-1, -1, -1):
+            members = [idx for idx in range(len(population)) if reached[idx] == rung]
+            if not members:
+                continue
+            if floor is not None:
+                shift = min(0, floor - 1 - max(means[idx] for idx in members))
+                for idx in members:
+                    fitnesses[idx] = means[idx] + shift
+            floor = min(fitnesses[idx] for idx in members)
+        self.results = [{'rung': rung, 'maps': list(individual_scores), 'scores': list(individual_scores.values()), 'mean_score': mean, 'fitness': fitness}
+                        for rung, individual_scores, mean, fitness in zip(reached, scores, means, fitnesses)]
+        self.best = max(alive, key=lambda idx: fitnesses[idx])
+        return fitnesses
+
+def play_GPac_batch(pac_controllers, ghost_controller=None, game_map=None, seeds=None, **kwargs):
+    '''
+    Batched counterpart of play_GPac that plays one game per entry of
+    pac_controllers in lockstep on a gpac.VecGPacGame. ghost_controller is
+    None (random ghosts), one controller for every game or a list with one
+    per game. Game i draws its randomness from seeds[i], so it matches
+    play_GPac(pac_controllers[i], ghost_controller) run after
+    random.seed(seeds[i]), or play_GPac(..., seed=seeds[i]) with
+    streams=True.
+
+    Returns an array of Pac-Man scores in the order of pac_controllers.
+    '''
+    game_map = load_game_map(game_map)
+    game = gpac.VecGPacGame(game_map, num_games=len(pac_controllers), seeds=seeds, **kwargs)
+    actions = np.zeros((game.num_games, len(game.players)), dtype=np.int64)
+    pac_evaluators = [None if controller is None else get_evaluator(controller) for controller in pac_controllers]
+    if not isinstance(ghost_controller, (list, tuple)):
+        ghost_controller = [ghost_controller]*game.num_games
+    assert len(ghost_controller) == game.num_games, f"ERROR: EXPECTED {game.num_games} GHOST CONTROLLERS BUT RECEIVED {len(ghost_controller)}"
+    ghost_evaluators = [None if controller is None else get_evaluator(controller) for controller in ghost_controller]
+
+    # game loop
+    while not game.gameover.all():
+        active = np.flatnonzero(~game.gameover)
+        for player_idx, player in enumerate(game.players):
+            options = game.get_actions(player_idx)
+            if 'm' in player and any(evaluator is not None for evaluator in pac_evaluators):
+                sensors = game.sense(player_idx)
+            elif 'm' not in player and any(evaluator is not None for evaluator in ghost_evaluators):
+                sensors = game.sense_ghost(player_idx)
+            for idx in active:
+                selected_action_idx = None
+                # select ghost actions using provided strategy
+                if 'm' not in player:
+                    if ghost_evaluators[idx] is None:
+                        # provided random ghost controller
+                        selected_action_idx = game.rngs[idx]['ghosts'].choice(range(len(options[idx])))
+                    else:
+                        scores = ghost_evaluators[idx](sensors[idx, list(options[idx])].tolist(), game.rngs[idx]['ghosts'])
+                        selected_action_idx = max(range(len(scores)), key=scores.__getitem__)
+
+                # select Pac-Man action(s) using provided strategy
+                else:
+                    if pac_evaluators[idx] is None:
+                        # random pac-man controller for demo purposes
+                        selected_action_idx = game.rngs[idx]['pacs'].choice(range(len(options[idx])))
+                    else:
+                        scores = pac_evaluators[idx](sensors[idx, list(options[idx])].tolist(), game.rngs[idx]['pacs'])
+                        selected_action_idx = max(range(len(scores)), key=scores.__getitem__)
+                actions[idx, player_idx] = options[idx][selected_action_idx]
+
+        game.step(actions)
+    return game.score
+
+def verify_batch_engine(game_map=None, seeds=range(16), pac_controllers=None, ghost_controller=None, streams=False, **kwargs):
+    '''
+    Checks that play_GPac_batch reproduces the scores of play_GPac under
+    identical seeds, for random Pac-Man controllers unless pac_controllers
+    (one per seed) are given, and random ghosts unless ghost_controller
+    (one for every seed or a list with one per seed) is given, with the
+    global random module seeded or (with streams) seeded game streams.
+    Raises AssertionError on a mismatch and returns the batched scores
+    otherwise.
+    '''
+    seeds = list(seeds)
+    if pac_controllers is None:
+        pac_controllers = [None]*len(seeds)
+    ghost_controllers = ghost_controller if isinstance(ghost_controller, (list, tuple)) else [ghost_controller]*len(seeds)
+    game_map = load_game_map(game_map)
+    batch_scores = play_GPac_batch(pac_controllers, ghost_controllers, game_map=game_map, seeds=seeds, streams=streams, **kwargs)
+    for seed, pac_controller, ghost_controller, batch_score in zip(seeds, pac_controllers, ghost_controllers, batch_scores):
+        if streams:
+            score, _ = play_GPac(pac_controller, ghost_controller, game_map=game_map, seed=seed, **kwargs)
+        else:
+            random.seed(seed)
+            score, _ = play_GPac(pac_controller, ghost_controller, game_map=game_map, **kwargs)
+        assert score == batch_score, f"ERROR: SEED {seed} SCORED {score} IN GPacGame BUT {batch_score} IN VecGPacGame"
+    return batch_scores
+
+if __name__ == '__main__':
+    from tree_genotype import TreeGenotype
+    for pill_spawn in ['stochastic', 'linear', 'manhattan']:
+        for num_pacs, num_ghosts in [(1, 3), (2, 4), (1, 0)]:
+            verify_batch_engine('./maps/map00.txt', pill_spawn=pill_spawn, num_pacs=num_pacs, num_ghosts=num_ghosts)
+            verify_batch_engine(pill_spawn=pill_spawn, num_pacs=num_pacs, num_ghosts=num_ghosts)
+    for distance_metric in ['manhattan', 'maze']:
+        verify_batch_engine('./maps/map00.txt', seeds=range(8), pac_controllers=TreeGenotype.initialization(8, depth_limit=4), distance_metric=distance_metric)
+        verify_batch_engine('./maps/map00.txt', seeds=range(8), pac_controllers=TreeGenotype.initialization(8, depth_limit=4),
+                            ghost_controller=TreeGenotype.initialization(8, depth_limit=4), distance_metric=distance_metric)
+    for pill_spawn in ['stochastic', 'linear']:
+        verify_batch_engine('./maps/map00.txt', seeds=range(8), pac_controllers=TreeGenotype.initialization(8, depth_limit=4), streams=True, pill_spawn=pill_spawn)
+        verify_batch_engine(seeds=range(8), ghost_controller=TreeGenotype.initialization(8, depth_limit=4), streams=True, pill_spawn=pill_spawn, num_pacs=2, num_ghosts=4)
+    print('VecGPacGame matches GPacGame')
@@ -0,0 +1,211 @@
+import json
+from collections.abc import Sequence
+import numpy as np
+
+MAGIC = b'GPACLOG1\n'
+
+def turn_dtype(num_players):
+    '''record layout of one turn: every player's location, the fruit spawned this turn (-1 if none), time and score'''
+    return np.dtype([('locations', np.int16, (num_players, 2)), ('fruit', np.int16, (2,)), ('time', np.int32), ('score', np.int32)])
+
+class GameLog(Sequence):
+    '''
+    Compact recording of a GPac game that reads as the list of world file
+    lines play_GPac has always returned.
+
+    Turns are stored in a growable NumPy record array (see turn_dtype) and
+    fruit spawns in an event list of (turn, x, y); turn 0 is the initial
+    state. Text lines are only produced when the log is indexed or iterated
+    (see to_text). With stream, the header and every recorded turn are also
+    written to that binary file as they happen (see read). With final_only,
+    only the initial state and the latest turn are kept in memory.
+    '''
+    def __init__(self, width, height, players, locations, wall_lines, pills, time, score, stream=None, final_only=False):
+        self.width = width
+        self.height = height
+        self.players = list(players)
+        self.wall_lines = wall_lines
+        self.pills = np.array(list(pills), dtype=np.int16).reshape(-1, 2)
+        self.fruit_events = list()
+        self.dtype = turn_dtype(len(self.players))
+        self.turns = np.zeros(min(1024, max(1, time+1)), dtype=self.dtype)
+        self.num_turns = 0
+        self.pending_fruit = None
+        self.final_only = final_only
+        self._text = None
+        self.stream = None
+        if stream is not None:
+            self.stream = open(stream, 'wb') if isinstance(stream, str) else stream
+            header = {'width': width, 'height': height, 'players': self.players, 'walls': [[int(coord) for coord in line.split(' ')[1:]] for line in wall_lines], 'pills': self.pills.tolist()}
+            self.stream.write(MAGIC + json.dumps(header).encode() + b'\n')
+        self.record_turn(locations, time, score)
+
+    def record_fruit(self, location):
+        '''records a fruit spawn during the turn currently being played'''
+        self.pending_fruit = location
+
+    def record_turn(self, locations, time, score, fruit_location=None):
+        '''
+        records the player locations, time and score at the end of a turn.
+        With final_only, the fruit on the board (fruit_location) is recorded
+        in the latest turn even if it spawned on a turn since overwritten, so
+        the final state shows it.
+        '''
+        if self.final_only and self.num_turns > 1:
+            # overwrite the previous turn, keeping only the initial state before it
+            self.num_turns = 1
+            self.fruit_events.clear()
+        if self.num_turns == len(self.turns):
+            self.turns = np.resize(self.turns, 2*len(self.turns))
+        if self.pending_fruit is None:
+            fruit = (-1, -1)
+        else:
+            fruit = self.pending_fruit
+            self.pending_fruit = None
+        self.turns[self.num_turns] = (list(locations), fruit, time, score)
+        if self.stream is not None:
+            # streams always hold spawn events, so they replay as full games
+            self.stream.write(self.turns[self.num_turns:self.num_turns+1].tobytes())
+        if self.final_only and fruit_location is not None:
+            fruit = fruit_location
+            self.turns[self.num_turns]['fruit'] = fruit
+        if fruit[0] >= 0:
+            self.fruit_events.append((self.num_turns, *fruit))
+        self.num_turns += 1
+        self._text = None
+
+    def truncate(self, num_turns):
+        '''forgets every turn after the first num_turns, e.g. after a rollout from a snapshot'''
+        assert self.stream is None, "ERROR: CANNOT TRUNCATE A STREAMED LOG"
+        if num_turns < self.num_turns:
+            self.num_turns = num_turns
+            self.fruit_events = [event for event in self.fruit_events if event[0] < num_turns]
+            self._text = None
+        self.pending_fruit = None
+
+    def close(self):
+        '''finishes the binary stream, if any'''
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    @property
+    def records(self):
+        '''record array of the turns played so far'''
+        return self.turns[:self.num_turns]
+
+    def to_text(self):
+        '''Returns the game as the list of world file lines GPacGame has always produced'''
+        if self._text is None:
+            records = self.records
+            lines = [f'{self.width}', f'{self.height}']
+            lines.extend(f'{player} {x} {y}' for player, (x, y) in zip(self.players, records[0]['locations'].tolist()))
+            lines.extend(self.wall_lines)
+            lines.extend(f'p {x} {y}' for x, y in self.pills.tolist())
+            lines.append(f't {records[0]["time"]} {records[0]["score"]}')
+            for locations, (fruit_x, fruit_y), time, score in zip(records['locations'][1:].tolist(), records['fruit'][1:].tolist(), records['time'][1:].tolist(), records['score'][1:].tolist()):
+                lines.extend(f'{player} {x} {y}' for player, (x, y) in zip(self.players, locations))
+                if fruit_x >= 0:
+                    lines.append(f'f {fruit_x} {fruit_y}')
+                lines.append(f't {time} {score}')
+            self._text = lines
+        return self._text
+
+    def __getitem__(self, idx):
+        return self.to_text()[idx]
+
+    def __len__(self):
+        # header, walls, pills and one time line, then the player lines and time line of every turn
+        return 2 + len(self.wall_lines) + len(self.pills) + self.num_turns*(len(self.players)+1) + len(self.fruit_events)
+
+    def __iter__(self):
+        return iter(self.to_text())
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['turns'] = self.records.copy()
+        state['stream'] = None
+        state['_text'] = None
+        return state
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def write(self, filename):
+        '''writes the world file text of the game to filename'''
+        with open(filename, 'w') as file:
+            file.writelines(f'{line}\n' for line in self)
+
+    @classmethod
+    def from_records(cls, width, height, players, wall_lines, pills, records):
+        '''Builds a finished log from its header and a turn record array'''
+        log = cls.__new__(cls)
+        log.width = width
+        log.height = height
+        log.players = list(players)
+        log.wall_lines = wall_lines
+        log.pills = np.array(pills, dtype=np.int16).reshape(-1, 2)
+        log.dtype = records.dtype
+        log.turns = records.copy()
+        log.num_turns = len(records)
+        log.fruit_events = [(turn, *records['fruit'][turn].tolist()) for turn in np.flatnonzero(records['fruit'][:, 0] >= 0)]
+        log.pending_fruit = None
+        log.final_only = False
+        log.stream = None
+        log._text = None
+        return log
+
+    @classmethod
+    def read(cls, filename):
+        '''Reads a game recorded with stream=filename'''
+        with open(filename, 'rb') as file:
+            assert file.readline() == MAGIC, f"ERROR: {filename} IS NOT A BINARY GPAC LOG"
+            header = json.loads(file.readline())
+            records = np.frombuffer(file.read(), dtype=turn_dtype(len(header['players'])))
+        return cls.from_records(header['width'], header['height'], header['players'], [f'w {x} {y}' for x, y in header['walls']], header['pills'], records)
+
+    @classmethod
+    def from_text(cls, lines):
+        '''Parses world file lines (e.g. a file from worldFiles/) into a GameLog in a single pass'''
+        lines = [line.rstrip('\n') for line in lines if line.strip()]
+        width, height = int(lines[0]), int(lines[1])
+        idx = 2
+        players, locations = list(), list()
+        while lines[idx][0] not in 'wpt':
+            player, x, y = lines[idx].split(' ')
+            players.append(player)
+            locations.append((int(x), int(y)))
+            idx += 1
+        wall_lines = list()
+        while lines[idx][0] == 'w':
+            wall_lines.append(lines[idx])
+            idx += 1
+        pills = list()
+        while lines[idx][0] == 'p':
+            _, x, y = lines[idx].split(' ')
+            pills.append((int(x), int(y)))
+            idx += 1
+
+        turns = list()
+        fruit = (-1, -1)
+        for line in lines[idx:]:
+            elements = line.split(' ')
+            if elements[0] == 't':
+                turns.append((locations, fruit, int(elements[1]), int(elements[2])))
+                locations, fruit = list(), (-1, -1)
+            elif elements[0] == 'f':
+                fruit = (int(elements[1]), int(elements[2]))
+            else:
+                locations.append((int(elements[1]), int(elements[2])))
+        records = np.array(turns, dtype=turn_dtype(len(players)))
+        return cls.from_records(width, height, players, wall_lines, pills, records)
+
+    @classmethod
+    def load(cls, filename):
+        '''Reads a binary log (see read) or a world file text log'''
+        with open(filename, 'rb') as file:
+            binary = file.read(len(MAGIC)) == MAGIC
+        if binary:
+            return cls.read(filename)
+        with open(filename) as file:
+            return cls.from_text(file)
@@ -0,0 +1,101 @@
+import pstats
+import time
+from collections import Counter
+
+def player_type(player):
+    return 'pac' if 'm' in player else 'ghost'
+
+class ProfileData():
+    '''raw cProfile statistics in the form pstats.Stats accepts, kept picklable for worker processes'''
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+class GameStats():
+    '''
+    Cumulative instrumentation of one or more GPac games.
+
+    seconds and calls are Counters keyed by (phase, player type), where the
+    player type is 'pac', 'ghost' or 'game' for phases that are not played
+    by a single player (nested phases, like manage_fruit inside step, are
+    timed in both). counts holds event totals (games, turns,
+    observations, pills, fruit, deaths). Stats of many games add up with +
+    or merge, e.g. sum(stats_list, GameStats()). profile holds cProfile
+    statistics if a profiled game was recorded (see print_profile).
+    '''
+    def __init__(self):
+        self.seconds = Counter()
+        self.calls = Counter()
+        self.counts = Counter()
+        self.profile = None
+
+    def add_time(self, phase, player_type, seconds, calls=1):
+        self.seconds[phase, player_type] += seconds
+        self.calls[phase, player_type] += calls
+
+    def timed(self, phase, method, per_player=False):
+        '''wraps method so every call is timed as phase (for the player passed to it if per_player)'''
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = method(*args, **kwargs)
+            key = (phase, player_type(kwargs.get('player', args[-1] if args else 'm')) if per_player else 'game')
+            self.seconds[key] += time.perf_counter() - start
+            self.calls[key] += 1
+            return result
+        return wrapper
+
+    def add_profile(self, profiler):
+        '''adds the statistics of a finished cProfile.Profile'''
+        profiler.create_stats()
+        self.merge_profile(ProfileData(profiler.stats))
+
+    def merge_profile(self, profile):
+        if self.profile is None:
+            self.profile = ProfileData(dict(profile.stats))
+        else:
+            combined = pstats.Stats(self.profile)
+            combined.add(profile)
+            self.profile = ProfileData(combined.stats)
+
+    def merge(self, other):
+        '''adds other's stats into these and returns self'''
+        self.seconds.update(other.seconds)
+        self.calls.update(other.calls)
+        self.counts.update(other.counts)
+        if other.profile is not None:
+            self.merge_profile(other.profile)
+        return self
+
+    def __add__(self, other):
+        return GameStats().merge(self).merge(other)
+
+    def __radd__(self, other):
+        # lets sum() start from 0
+        return self if other == 0 else self + other
+
+    def to_dict(self):
+        '''JSON-serializable summary of every phase and count'''
+        phases = dict()
+        for (phase, kind), seconds in sorted(self.seconds.items()):
+            calls = self.calls[phase, kind]
+            phases[f'{phase}/{kind}'] = {'calls': calls, 'seconds': seconds, 'mean_us': 1e6*seconds/calls if calls else 0.0}
+        return {'phases': phases, 'counts': dict(self.counts)}
+
+    def summary(self):
+        '''table of phases sorted by total time, followed by the counts'''
+        total = sum(self.seconds.values())
+        lines = [f'{"phase":<28}{"calls":>10}{"total s":>10}{"us/call":>10}{"share":>8}']
+        for (phase, kind), seconds in self.seconds.most_common():
+            calls = self.calls[phase, kind]
+            lines.append(f'{phase + "/" + kind:<28}{calls:>10}{seconds:>10.3f}{1e6*seconds/max(1, calls):>10.2f}{seconds/total if total else 0:>8.1%}')
+        lines.append(', '.join(f'{name}: {count}' for name, count in sorted(self.counts.items())))
+        return '\n'.join(lines)
+
+    def print_profile(self, sort='cumulative', limit=20):
+        assert self.profile is not None, "ERROR: NO PROFILED GAMES WERE RECORDED"
+        pstats.Stats(self.profile).sort_stats(sort).print_stats(limit)
+
+    def __repr__(self):
+        return f'GameStats({self.to_dict()})'
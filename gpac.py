@@ -1,112 +1,710 @@
+import os
 import random
-from copy import deepcopy
-import matplotlib.pyplot as plt
-import matplotlib.path as mpath
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from functools import lru_cache
+import numpy as np
+from game_log import GameLog
 
 GHOST_ACTIONS = {'up':(0,1), 'right':(1,0), 'down':(0,-1), 'left':(-1,0)}
 PAC_ACTIONS = {'hold':(0,0)}
 PAC_ACTIONS.update(GHOST_ACTIONS)
 
-# pac-man icon creation
-pac_vertices = deepcopy(mpath.Path.unit_circle().vertices)
-pac_codes = deepcopy(mpath.Path.unit_circle().codes)
-pac_vertices[5] = [0,0]
-pac_vertices[6] = [0,0]
-pac_vertices[7] = [0,0]
-PAC_ICON = mpath.Path(vertices=pac_vertices,codes=pac_codes)
-# ghost icon creation
-fin_depth = 0.5
-ghost_vertices = deepcopy(mpath.Path.unit_circle().vertices)
-ghost_codes = deepcopy(mpath.Path.unit_circle().codes)
-ghost_vertices[1] = [0.25,-fin_depth]
-ghost_vertices[2] = [0.5, -1]
-ghost_vertices[3] = [0.75, -fin_depth]
-ghost_vertices[4] = [1, -1]
-ghost_vertices[5] = [1, 0]
-ghost_vertices[19] = [-1, -1]
-ghost_vertices[20] = [-0.75, -fin_depth]
-ghost_vertices[21] = [-0.5, -1]
-ghost_vertices[22] = [-0.25, -fin_depth]
-ghost_vertices[23] = [0, -1]
-ghost_codes[1] = 2
-ghost_codes[2] = 2
-ghost_codes[3] = 2
-ghost_codes[4] = 2
-ghost_codes[5] = 2
-ghost_codes[6] = 2
-ghost_codes[19] = 2
-ghost_codes[20] = 2
-ghost_codes[21] = 2
-ghost_codes[22] = 2
-ghost_codes[23] = 2
-GHOST_ICON = mpath.Path(vertices=ghost_vertices,codes=ghost_codes)
+def parse_map(filename):
+    game_map = list()
+    with open(filename) as file:
+        line = file.readline()
+        line = line.rstrip('\n').split(' ')
+        width, height = int(line[0]), int(line[1])
+        game_map = [[None for y in range(height)] for x in range(width)]
+        y = -1
+        while line := file.readline():
+            for x, char in enumerate(line):
+                if char == '~':
+                    game_map[x][y] = 0
+                elif char == '#':
+                    game_map[x][y] = 1
+            y -= 1
+    return game_map
 
-class GPacGame():
-    def __init__(self, game_map, pill_density=0.1, fruit_prob=0.2, fruit_score=10, time_multiplier=2, num_ghosts=3, num_pacs=1, pill_spawn = 'stochastic', **kwargs):
+class CompiledMap():
+    '''
+    Immutable, precomputed form of a game map that games can share.
+
+    Holds the original [x][y] grid (as tuples, so it cannot be changed), flat (x*height+y) wall and open-cell
+    arrays, the open cells in [x][y] scan order, per-cell legal actions for
+    Pac-Man and ghosts, and the pre-rendered wall lines of a world file.
+    Maze distances between open cells are available through distances once
+    first requested (see distance_table, or DistanceRows for maps with more
+    than MAX_TABLE_CELLS open cells).
+    '''
+    def __init__(self, game_map, move_mask=None, source=None):
         assert len(game_map) > 0 and min([len(col) for col in game_map]) > 0, "ERROR: MAP MUST BE 2 DIMENSIONAL"
-        self.map = game_map[:][:]
-        self.width = len(self.map)
-        self.height = max([len(col) for col in self.map])
+        self.grid = tuple(tuple(col) for col in game_map)
+        self.width = len(self.grid)
+        self.height = max([len(col) for col in self.grid])
+        # -1 marks cells that are neither open nor walls (e.g. short map rows)
+        cells = np.full((self.width, self.height), -1, dtype=np.int8)
+        for x, col in enumerate(self.grid):
+            for y, cell in enumerate(col):
+                if cell in (0, 1):
+                    cells[x, y] = cell
+        self.cells = cells
+        self.walls = (cells == 1).ravel().astype(np.uint8)
+        self.open = (cells == 0).ravel()
+        self.open_cells = [divmod(int(cell), self.height) for cell in np.flatnonzero(self.open)]
+        # flat cell -> row/column of the distance table, -1 for closed cells
+        self.open_index = np.full(self.width*self.height, -1, dtype=np.int32)
+        self.open_index[self.open] = np.arange(len(self.open_cells), dtype=np.int32)
+        self.source = source
+        self._distances = None
+        self._pill_candidates = dict() # (forbidden locations, manhattan) -> candidates, see pill_candidates
+        self.wall_lines = [f'w {x} {y}' for x, y in (divmod(int(cell), self.height) for cell in np.flatnonzero(self.walls))]
+
+        # legal actions per cell in PAC_ACTIONS order: the target cell is open (and the
+        # cell itself lies within its column)
+        if move_mask is None:
+            column_lengths = np.array([len(col) for col in self.grid])
+            in_column = np.arange(self.height)[None, :] < column_lengths[:, None]
+            move_mask = np.zeros((self.width, self.height, len(PAC_ACTIONS)), dtype=bool)
+            for code, (x_shift, y_shift) in enumerate(PAC_ACTIONS.values()):
+                sources = (slice(max(0, -x_shift), self.width - max(0, x_shift)), slice(max(0, -y_shift), self.height - max(0, y_shift)))
+                targets = (slice(max(0, x_shift), self.width + min(0, x_shift)), slice(max(0, y_shift), self.height + min(0, y_shift)))
+                move_mask[sources + (code,)] = (cells[targets] == 0) & in_column[sources]
+            move_mask = move_mask.reshape(-1, len(PAC_ACTIONS))
+        self.move_mask = move_mask
+        # cells share one tuple of actions per distinct row of move_mask
+        actions = list(PAC_ACTIONS)
+        patterns = move_mask.astype(np.int64) @ (1 << np.arange(len(PAC_ACTIONS)))
+        pac_patterns = {int(pattern): tuple(action for code, action in enumerate(actions) if pattern >> code & 1) for pattern in np.unique(patterns)}
+        ghost_patterns = {pattern: tuple(action for action in moves if action in GHOST_ACTIONS) for pattern, moves in pac_patterns.items()}
+        xs, ys = np.divmod(np.arange(self.width*self.height), self.height)
+        locations = list(zip(xs.tolist(), ys.tolist()))
+        patterns = patterns.tolist()
+        self.pac_moves = dict(zip(locations, map(pac_patterns.__getitem__, patterns)))
+        self.ghost_moves = dict(zip(locations, map(ghost_patterns.__getitem__, patterns)))
+
+    def __len__(self):
+        return self.width
+
+    def __getstate__(self):
+        # workers re-map the distance table from disk instead of receiving a copy
+        state = self.__dict__.copy()
+        state['_distances'] = None
+        return state
+
+    @property
+    def distances(self):
+        '''All-pairs maze distances between open cells, indexed by open_index'''
+        if self._distances is None:
+            if len(self.open_cells) > MAX_TABLE_CELLS:
+                self._distances = DistanceRows(self)
+            elif self.source is None:
+                self._distances = distance_table(self)
+            else:
+                self._distances = load_distance_table(self)
+        return self._distances
+
+    def pill_candidates(self, forbidden_locations, manhattan=False):
+        '''open cells outside forbidden_locations (a frozenset) in pill placement order, computed once per spawn'''
+        key = (forbidden_locations, manhattan)
+        if key not in self._pill_candidates:
+            available_locations = [location for location in self.open_cells if location not in forbidden_locations]
+            if manhattan:
+                available_locations = sorted(available_locations, key=lambda location: location[0]+location[1])
+            self._pill_candidates[key] = tuple(available_locations)
+        return self._pill_candidates[key]
+
+    def cell_index(self, location):
+        '''Row/column of location in the distance table, -1 if it is not an open cell'''
+        x, y = location
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return int(self.open_index[x*self.height+y])
+        return -1
+
+    def maze_distance(self, location0, location1):
+        '''Shortest path length between two open cells, UNREACHABLE if there is none'''
+        return int(self.distances[self.cell_index(location0), self.cell_index(location1)])
+
+    def __getitem__(self, x):
+        return self.grid[x]
+
+    def save(self, filename):
+        '''Writes the compiled map to a binary .npz file'''
+        np.savez(filename, cells=self.cells, move_mask=self.move_mask)
+
+    @classmethod
+    def load(cls, filename, source=None):
+        '''Reads a compiled map written by save'''
+        with np.load(filename) as data:
+            cells = data['cells']
+            grid = [[None if cell < 0 else int(cell) for cell in col] for col in cells]
+            return cls(grid, move_mask=data['move_mask'], source=source)
+
+# distance table entry for cells that cannot reach each other
+UNREACHABLE = np.iinfo(np.uint16).max
+# open cells of the largest map given a full distance table (2 bytes per pair, 512MB here);
+# larger maps compute rows on demand (see DistanceRows)
+MAX_TABLE_CELLS = 1 << 14
+
+# independent random streams of a seeded game: pill layout, fruit spawns, ghost
+# moves and Pac-Man moves (random policy and RAND nodes)
+RNG_STREAMS = ('pills', 'fruit', 'ghosts', 'pacs')
+
+def copy_rng(rng):
+    '''independent random.Random in the same state as rng'''
+    copy = random.Random.__new__(random.Random)
+    copy.setstate(rng.getstate())
+    return copy
+
+def rng_streams(seed=None):
+    '''
+    {stream: random number generator} for one game. With a seed, every
+    stream is its own random.Random derived from it, so changing how one
+    stream is used (e.g. a Pac-Man controller drawing more RAND values)
+    leaves the others untouched. Without, every stream is None and draws
+    from the global random module (see GPacGame.rng), in the order games
+    always have; the module itself is not stored so games stay picklable.
+    '''
+    if seed is None:
+        return dict.fromkeys(RNG_STREAMS)
+    return {stream: random.Random(f'{seed}:{stream}') for stream in RNG_STREAMS}
+
+def maze_neighbors(compiled_map):
+    '''(open cells, 4) array of the open cell reached by each ghost action from every open cell (or the cell itself)'''
+    num_cells = len(compiled_map.open_cells)
+    neighbors = np.repeat(np.arange(num_cells)[:, None], len(GHOST_ACTIONS), axis=1)
+    offsets = [x_shift*compiled_map.height + y_shift for x_shift, y_shift in GHOST_ACTIONS.values()]
+    codes = [list(PAC_ACTIONS).index(action) for action in GHOST_ACTIONS]
+    flat_cells = np.flatnonzero(compiled_map.open)
+    for column, (code, offset) in enumerate(zip(codes, offsets)):
+        legal = compiled_map.move_mask[flat_cells, code]
+        neighbors[legal, column] = compiled_map.open_index[flat_cells[legal] + offset]
+    return neighbors
+
+def bfs_distances(neighbors, sources, dtype=np.uint16):
+    '''
+    (len(sources), cells) shortest path lengths from each source open cell
+    by breadth-first search over maze_neighbors, the maximum of dtype where
+    a cell is unreachable. Each step only expands the frontier, so long
+    corridors cost no more than open rooms.
+    '''
+    num_cells = len(neighbors)
+    unvisited = np.iinfo(dtype).max
+    # the frontier holds flat (source row, cell) indices of the distances
+    distances = np.full(len(sources)*num_cells, unvisited, dtype=dtype)
+    frontier = np.arange(len(sources))*num_cells + np.asarray(sources)
+    distances[frontier] = 0
+    distance = 0
+    while len(frontier):
+        distance += 1
+        rows, cells = np.divmod(frontier, num_cells)
+        reached = (rows[:, None]*num_cells + neighbors[cells]).ravel()
+        frontier = np.unique(reached[distances[reached] == unvisited])
+        distances[frontier] = distance
+    return distances.reshape(len(sources), num_cells)
+
+def distance_table(compiled_map, out=None, block_cells=1 << 24):
+    '''
+    Computes all-pairs shortest path lengths between the open cells of a
+    compiled map with breadth-first searches from blocks of source cells at
+    once, writing each block of rows into out (a new array, or e.g. a
+    memory-mapped one) as it finishes. A block holds about block_cells
+    distances, so working memory does not grow with the square of the map
+    size. Paths are shorter than the number of open cells, which must stay
+    below UNREACHABLE so no distance reaches it.
+    '''
+    num_cells = len(compiled_map.open_cells)
+    assert num_cells < UNREACHABLE, f"ERROR: {num_cells} OPEN CELLS EXCEED THE {UNREACHABLE-1} A DISTANCE TABLE SUPPORTS"
+    neighbors = maze_neighbors(compiled_map)
+    if out is None:
+        out = np.empty((num_cells, num_cells), dtype=np.uint16)
+    block_size = max(1, block_cells // max(1, num_cells))
+    for start in range(0, num_cells, block_size):
+        out[start:start + block_size] = bfs_distances(neighbors, np.arange(start, min(start + block_size, num_cells)))
+    return out
+
+class DistanceRows():
+    '''
+    Stands in for the distance table of maps too large for one (see
+    MAX_TABLE_CELLS). Supports table[i, j] and table[np.ix_(rows, columns)];
+    the row of each requested column's cell is found by breadth-first
+    search when first needed (distances are symmetric) and the most recent
+    max_entries distances are kept. Distances are uint16 like the table's,
+    with paths longer than UNREACHABLE-1 saturating at UNREACHABLE-1.
+    '''
+    def __init__(self, compiled_map, max_entries=1 << 26):
+        self.neighbors = maze_neighbors(compiled_map)
+        self.num_cells = len(self.neighbors)
+        self.dtype = np.uint16 if self.num_cells < UNREACHABLE else np.uint32
+        self.max_rows = max(1, max_entries // max(1, self.num_cells))
+        self.rows = OrderedDict()
+
+    @property
+    def shape(self):
+        return (self.num_cells, self.num_cells)
+
+    def row(self, cell):
+        '''distances from open cell index cell to every open cell'''
+        if cell in self.rows:
+            self.rows.move_to_end(cell)
+            return self.rows[cell]
+        distances = bfs_distances(self.neighbors, [cell], self.dtype)[0]
+        if self.dtype != np.uint16:
+            unreachable = distances == np.iinfo(self.dtype).max
+            distances = np.minimum(distances, UNREACHABLE-1).astype(np.uint16)
+            distances[unreachable] = UNREACHABLE
+        self.rows[cell] = distances
+        if len(self.rows) > self.max_rows:
+            self.rows.popitem(last=False)
+        return distances
+
+    def __getitem__(self, key):
+        rows, columns = key
+        if np.ndim(columns) == 0:
+            return self.row(int(columns))[rows]
+        # np.ix_ index: rows is a (rows, 1) and columns a (1, columns) array
+        table = np.stack([self.row(int(column)) for column in np.ravel(columns)], axis=1)
+        return table[np.ravel(rows)]
+
+def distance_cache_path(filename):
+    '''Location of the distance table for a map file, e.g. maps/__mapcache__/map00.dist.npy'''
+    return os.path.splitext(map_cache_path(filename))[0] + '.dist.npy'
+
+def load_distance_table(compiled_map):
+    '''
+    Memory-maps the distance table stored next to the map file of
+    compiled_map, building and saving it first if it is missing or stale.
+    Processes that load the same table share its pages.
+    '''
+    cache_path = distance_cache_path(compiled_map.source)
+    if not os.path.exists(cache_path) or os.stat(cache_path).st_mtime_ns < os.stat(compiled_map.source).st_mtime_ns:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = f'{cache_path}.{os.getpid()}.npy'
+        num_cells = len(compiled_map.open_cells)
+        # rows are written straight to disk, so large maps never hold the whole table in memory
+        table = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.uint16, shape=(num_cells, num_cells))
+        distance_table(compiled_map, out=table)
+        table.flush()
+        del table
+        os.replace(temp_path, cache_path) # atomic, so concurrent builders never see partial tables
+    return np.load(cache_path, mmap_mode='r')
+
+def map_cache_path(filename):
+    '''Location of the binary cache for a map file, e.g. maps/__mapcache__/map00.npz'''
+    directory, name = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, '__mapcache__', os.path.splitext(name)[0] + '.npz')
+
+def load_map(filename, persist=False):
+    '''
+    Returns the CompiledMap for a map file, memoized by path and modification
+    time. With persist, the compiled map is also read from or written to a
+    binary cache file next to the map (see map_cache_path).
+    '''
+    filename = os.path.abspath(filename)
+    return _load_map(filename, os.stat(filename).st_mtime_ns, persist)
+
+@lru_cache(maxsize=None)
+def _load_map(filename, mtime_ns, persist):
+    if not persist:
+        return CompiledMap(parse_map(filename), source=filename)
+    cache_path = map_cache_path(filename)
+    if os.path.exists(cache_path) and os.stat(cache_path).st_mtime_ns >= mtime_ns:
+        return CompiledMap.load(cache_path, source=filename)
+    compiled_map = CompiledMap(parse_map(filename), source=filename)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    compiled_map.save(cache_path)
+    return compiled_map
+
+class DistanceField():
+    '''
+    Multi-source distance field over the open cells of a compiled map.
+
+    nearest[i] is the distance from open cell i to the closest source, or
+    UNREACHABLE when there is none, under the 'manhattan' metric or the
+    'maze' metric of CompiledMap.distances. Adding a source costs O(cells);
+    removing one only recomputes the cells whose closest source it was.
+    '''
+    def __init__(self, compiled_map, sources=(), metric='manhattan'):
+        metrics = {'manhattan', 'maze'}
+        assert metric in metrics, f"ERROR: UNRECOGNIZED DISTANCE METRIC {metric} BUT EXPECTED {metrics}"
+        self.compiled_map = compiled_map
+        self.metric = metric
+        self.xs, self.ys = np.divmod(np.flatnonzero(compiled_map.open), compiled_map.height)
+        self.sources = set(sources)
+        self.nearest = self.distances(self.xs, self.ys, self.sources)
+
+    def distances(self, xs, ys, sources):
+        '''Distance from each cell (xs[i], ys[i]) to its closest source in sources'''
+        if not sources:
+            return np.full(len(xs), UNREACHABLE, dtype=np.int32)
+        sources = np.array(list(sources))
+        if self.metric == 'manhattan':
+            return (np.abs(xs[:, None] - sources[:, 0]) + np.abs(ys[:, None] - sources[:, 1])).min(axis=1).astype(np.int32)
+        cells = self.compiled_map.open_index[xs*self.compiled_map.height + ys]
+        columns = self.compiled_map.open_index[sources[:, 0]*self.compiled_map.height + sources[:, 1]]
+        return self.compiled_map.distances[np.ix_(cells, columns)].min(axis=1).astype(np.int32)
+
+    def add(self, location):
+        if location not in self.sources:
+            self.sources.add(location)
+            np.minimum(self.nearest, self.distances(self.xs, self.ys, (location,)), out=self.nearest)
+
+    def remove(self, location):
+        if location in self.sources:
+            self.sources.remove(location)
+            affected = np.flatnonzero(self.nearest == self.distances(self.xs, self.ys, (location,)))
+            self.nearest[affected] = self.distances(self.xs[affected], self.ys[affected], self.sources)
+
+    def clear(self):
+        self.sources.clear()
+        self.nearest.fill(UNREACHABLE)
+
+    def copy(self):
+        '''independent field over the same map (cell coordinates are shared)'''
+        field = DistanceField.__new__(DistanceField)
+        field.compiled_map, field.metric, field.xs, field.ys = self.compiled_map, self.metric, self.xs, self.ys
+        field.sources = set(self.sources)
+        field.nearest = self.nearest.copy()
+        return field
+
+    def __getitem__(self, location):
+        '''Distance from the open cell at location to its closest source'''
+        return int(self.nearest[self.compiled_map.cell_index(location)])
+
+class FreeCellIndex():
+    '''
+    The open cells of a compiled map that hold no pill, kept in open_cells
+    order in a Fenwick tree of 0/1 counts, so adding or removing a cell and
+    finding the k-th free cell cost O(log n). sample draws the cell that
+    random.choice would draw from the list of free cells, with the same
+    random numbers.
+    '''
+    __slots__ = ('compiled_map', 'free', 'tree', 'count', 'top')
+
+    def __init__(self, compiled_map, occupied=()):
+        self.compiled_map = compiled_map
+        size = len(compiled_map.open_cells)
+        self.free = bytearray([1])*size
+        for location in occupied:
+            self.free[compiled_map.cell_index(location)] = 0
+        # tree[i] counts the free cells in (i - lowbit(i), i], from prefix sums in O(n)
+        prefix = np.concatenate(([0], np.cumsum(np.frombuffer(self.free, dtype=np.uint8), dtype=np.int64)))
+        i = np.arange(size+1)
+        self.tree = (prefix - prefix[i - (i & -i)]).tolist()
+        self.count = int(prefix[-1])
+        self.top = 1 << (size.bit_length()-1) if size else 0
+
+    def _update(self, idx, delta):
+        i = idx+1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def add(self, location):
+        idx = self.compiled_map.cell_index(location)
+        if not self.free[idx]:
+            self.free[idx] = 1
+            self.count += 1
+            self._update(idx, 1)
+
+    def remove(self, location):
+        idx = self.compiled_map.cell_index(location)
+        if self.free[idx]:
+            self.free[idx] = 0
+            self.count -= 1
+            self._update(idx, -1)
+
+    def __contains__(self, location):
+        idx = self.compiled_map.cell_index(location)
+        return idx >= 0 and bool(self.free[idx])
+
+    def __len__(self):
+        return self.count
+
+    def rank(self, idx):
+        '''number of free cells before open cell idx'''
+        total = 0
+        while idx > 0:
+            total += self.tree[idx]
+            idx -= idx & -idx
+        return total
+
+    def select(self, k):
+        '''open cell index of the k-th (from 0) free cell'''
+        idx, bit = 0, self.top
+        while bit:
+            if idx+bit < len(self.tree) and self.tree[idx+bit] <= k:
+                idx += bit
+                k -= self.tree[idx]
+            bit >>= 1
+        return idx
+
+    def sample(self, exclude=(), rng=random):
+        '''
+        Uniformly random free cell that is not in exclude (a few locations,
+        e.g. the Pac-Men), or None if there is none.
+        '''
+        cells = {self.compiled_map.cell_index(location) for location in exclude}
+        skipped = sorted(self.rank(idx) for idx in cells if idx >= 0 and self.free[idx])
+        available = self.count - len(skipped)
+        if available <= 0:
+            return None
+        k = rng.randrange(available)
+        # shift k past the excluded cells to its position among all free cells
+        for rank in skipped:
+            if rank > k:
+                break
+            k += 1
+        return self.compiled_map.open_cells[self.select(k)]
+
+    def copy(self):
+        index = FreeCellIndex.__new__(FreeCellIndex)
+        index.compiled_map, index.count, index.top = self.compiled_map, self.count, self.top
+        index.free = self.free[:]
+        index.tree = self.tree[:]
+        return index
+
+class PlayersView(MutableMapping):
+    '''
+    Player locations of an observation: a snapshot of the game's players
+    dict with one player moved. The snapshot is only copied when written.
+    '''
+    __slots__ = ('_players', '_player', '_location', '_copy')
+
+    def __init__(self, players, player, location):
+        self._players = players
+        self._player = player
+        self._location = location
+        self._copy = None
+
+    def __getitem__(self, player):
+        if self._copy is not None:
+            return self._copy[player]
+        if player == self._player:
+            return self._location
+        return self._players[player]
+
+    def __setitem__(self, player, location):
+        if self._copy is None:
+            self._copy = dict(self)
+        self._copy[player] = location
+
+    def __delitem__(self, player):
+        if self._copy is None:
+            self._copy = dict(self)
+        del self._copy[player]
+
+    def __iter__(self):
+        return iter(self._players if self._copy is None else self._copy)
+
+    def __len__(self):
+        return len(self._players if self._copy is None else self._copy)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class GPacSnapshot():
+    '''
+    Compact state of a GPacGame between turns (see GPacGame.snapshot).
+    Immutable parts (players dict, pills frozenset, distance fields until
+    the game next writes to them) are shared with the game, not copied.
+    '''
+    __slots__ = ('players', 'pills', 'fruit_location', 'pills_consumed', 'fruit_consumed', 'time', 'score', 'bonus',
+                 'gameover', 'graveyard', 'registered_actions', 'pill_field', 'fruit_field', 'free_cells', 'rng_state', 'log_turns')
+
+    def __init__(self, game, capture_rng=True):
+        self.players = game.players
+        self.pills = game.pills
+        self.fruit_location = game.fruit_location
+        self.pills_consumed = game.pills_consumed
+        self.fruit_consumed = game.fruit_consumed
+        self.time = game.time
+        self.score = game.score
+        self.bonus = game.bonus
+        self.gameover = game.gameover
+        self.graveyard = frozenset(game.graveyard)
+        self.registered_actions = dict(game.registered_actions) if game.registered_actions else None
+        self.pill_field = game._pill_field
+        self.fruit_field = game._fruit_field
+        self.free_cells = game._free_cells
+        self.rng_state = game.get_rng_state() if capture_rng else None
+        self.log_turns = None if game.log is None else game.log.num_turns
+
+class GPacObservation(MutableMapping):
+    '''
+    Lightweight state s' resulting from one candidate action.
+
+    Reads like the state dicts of the 'dict' observation mode ('walls',
+    'pills', 'fruit' and 'players' keys, also available as attributes) but
+    shares the game's walls (the immutable grid of its CompiledMap), its
+    frozenset of pills and its players dict, and stores only the
+    hypothetical location of the acting player. Shared state is read-only;
+    assigning a key copies it into a private dict first (with pills as a
+    list, as in 'dict' mode), so controllers can never modify the game
+    through an observation.
+    '''
+    __slots__ = ('walls', 'pills', 'fruit', 'players', 'player', 'location', '_state')
+    KEYS = ('walls', 'pills', 'fruit', 'players')
+
+    def __init__(self, walls, pills, fruit, players, player, location):
+        self.walls = walls
+        self.pills = pills
+        self.fruit = fruit
+        self.players = PlayersView(players, player, location)
+        self.player = player
+        self.location = location
+        self._state = None
+
+    def __getitem__(self, key):
+        if self._state is not None:
+            return self._state[key]
+        if key not in GPacObservation.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if self._state is None:
+            self._state = self.to_dict()
+        self._state[key] = value
+
+    def __delitem__(self, key):
+        if self._state is None:
+            self._state = self.to_dict()
+        del self._state[key]
+
+    def __iter__(self):
+        return iter(GPacObservation.KEYS if self._state is None else self._state)
+
+    def __len__(self):
+        return len(GPacObservation.KEYS if self._state is None else self._state)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def to_dict(self):
+        '''Returns an independent state dict in the 'dict' observation format'''
+        if self._state is not None:
+            return {key: value for key, value in self._state.items()}
+        return {'walls': list(self.walls), 'pills': list(self.pills), 'fruit': self.fruit, 'players': dict(self.players)}
+
+class GPacGame():
+    def __init__(self, game_map, pill_density=0.1, fruit_prob=0.2, fruit_score=10, time_multiplier=2, num_ghosts=3, num_pacs=1, pill_spawn = 'stochastic', observation_mode='view', distance_metric='manhattan', log_level='full', log_stream=None, stats=None, seed=None, horizon=None, **kwargs):
+        if not isinstance(game_map, CompiledMap):
+            game_map = CompiledMap(game_map)
+        self.compiled_map = game_map
+        self.map = game_map.grid
+        self.width = game_map.width
+        self.height = game_map.height
         self.players = {'m': ()}
         for pac in range(num_pacs-1):
             self.players[f'm{pac}'] =  ()
         for ghost in range(num_ghosts):
             self.players[f'{ghost}'] = ()
+        # player roles are fixed, so they are split once: players[pac_players[i]] is Pac-Man i
+        self.pac_players = tuple(player for player in self.players if 'm' in player)
+        self.ghost_players = tuple(player for player in self.players if 'm' not in player)
+        self.is_pac = {player: player in self.pac_players for player in self.players}
+        # cells holding a ghost during collision detection (always cleared again after)
+        self._occupancy = bytearray(self.width*self.height)
         self.pill_density = pill_density
         self.fruit_prob = fruit_prob
         self.fruit_score = fruit_score
         self.time_multiplier = time_multiplier
+        # with a horizon (a fraction of the game's time), the game stops early once that much time has passed;
+        # time and the clear bonus still count from the full game's time, so it is a prefix of the full game
+        self.horizon = horizon
         self.pill_spawn = pill_spawn
+        observation_modes = {'view', 'dict'}
+        assert observation_mode in observation_modes, f"ERROR: UNRECOGNIZED OBSERVATION MODE {observation_mode} BUT EXPECTED {observation_modes}"
+        self.observation_mode = observation_mode
+        self.distance_metric = distance_metric
+        log_levels = {'full', 'final', 'none'}
+        assert log_level in log_levels, f"ERROR: UNRECOGNIZED LOG LEVEL {log_level} BUT EXPECTED {log_levels}"
+        self.log_level = log_level
+        self.log_stream = log_stream
+        # pills, fruit and the players of play_GPac draw from rngs (see rng_streams)
+        self.seed = seed
+        self.rngs = rng_streams(seed)
+        self.stats = None
+        if stats is not None:
+            self.instrument(stats)
         self.reset()
 
+    def instrument(self, stats):
+        '''
+        Records get_actions, get_observations (per player type), step and
+        manage_fruit times into stats (a game_stats.GameStats), along with
+        counts of turns, observations built and pills, fruit and Pac-Men
+        consumed. Uninstrumented games pay nothing for this.
+        '''
+        self.stats = stats
+        self.get_actions = stats.timed('get_actions', self.get_actions, per_player=True)
+        self.manage_fruit = stats.timed('manage_fruit', self.manage_fruit)
+        timed_observations = stats.timed('get_observations', self.get_observations, per_player=True)
+        timed_step = stats.timed('step', self.step)
+
+        def get_observations(actions, player='m'):
+            observations = timed_observations(actions, player)
+            stats.counts['observations'] += len(observations)
+            return observations
+
+        def step():
+            pills, fruit, deaths = self.pills_consumed, self.fruit_consumed, len(self.graveyard)
+            timed_step()
+            stats.counts['turns'] += 1
+            stats.counts['pills'] += self.pills_consumed - pills
+            stats.counts['fruit'] += self.fruit_consumed - fruit
+            stats.counts['deaths'] += len(self.graveyard) - deaths
+            if self.gameover:
+                stats.counts['games'] += 1
+
+        self.get_observations = get_observations
+        self.step = step
+
     def reset(self):
-        # spawn players
+        # spawn players (in a new dict, since snapshots may share the old one)
+        players = dict()
         for player in self.players:
-            if 'm' in player:
-                self.players[player] = (0, len(self.map[0])-1)
+            if self.is_pac[player]:
+                players[player] = (0, len(self.map[0])-1)
             else:
-                self.players[player] = (len(self.map)-1,0)
+                players[player] = (len(self.map)-1,0)
+        self.players = players
         self.pills_consumed = 0
         self.pills = set()
 
         placement_strategies = {'stochastic', 'linear', 'manhattan'}
         assert self.pill_spawn in placement_strategies, f"ERROR: UNRECOGNIZED PILL SPAWN STRATEGY {self.pill_spawn} BUT EXPECTED {placement_strategies}"
-        # generate pill placement
+        # generate pill placement on open cells other than the spawning locations of pac-man and ghosts
+        forbidden_locations = frozenset(self.players.values())
+        available_locations = self.compiled_map.pill_candidates(forbidden_locations, self.pill_spawn.casefold() == 'manhattan')
         if self.pill_spawn.casefold() == 'stochastic':
-            for x in range(len(self.map)):
-                for y in range(len(self.map[x])):
-                    # skip spawning location of pac-man and ghosts
-                    if (x,y) in self.players.values():
-                        continue
-                    if self.map[x][y] == 0 and random.random() <= self.pill_density:
-                        self.pills.add((x,y))
+            rng = self.rng('pills')
+            for location in available_locations:
+                if rng.random() <= self.pill_density:
+                    self.pills.add(location)
             if len(self.pills) == 0: # failsafe logic to guarantee pill placement
-                forbidden_locations = {self.players[player] for player in self.players}
-                available_locations = list()
-                for x in range(len(self.map)):
-                    for y in range(len(self.map[x])):
-                        if self.map[x][y] == 0 and (x, y) not in forbidden_locations:
-                            available_locations.append((x, y))
                 assert len(available_locations) > 0, "ERROR: NO VALID PILL LOCATIONS"
-                self.pills.add(random.choice(available_locations))
+                self.pills.add(rng.choice(available_locations))
         elif self.pill_spawn.casefold() == 'linear' or self.pill_spawn.casefold() == 'manhattan':
-            forbidden_locations = {self.players[player] for player in self.players}
-            available_locations = list()
-            for x in range(len(self.map)):
-                for y in range(len(self.map[x])):
-                    if self.map[x][y] == 0 and (x, y) not in forbidden_locations:
-                        available_locations.append((x, y))
             assert len(available_locations) > 0, "ERROR: NO VALID PILL LOCATIONS"
             pill_freq = max(1,int(round(1/self.pill_density)))
-            if self.pill_spawn.casefold() == 'manhattan':
-                available_locations = sorted(available_locations, key=lambda location: location[0]+location[1])
-            for i in range(len(available_locations)):
-                if i%pill_freq==0:
-                    self.pills.add(available_locations[i])
+            # every pill_freq-th cell (in Manhattan distance order for 'manhattan')
+            self.pills.update(available_locations[::pill_freq])
+        # pills are replaced rather than modified so observations can share them
+        self.pills = frozenset(self.pills)
 
         self.fruit_consumed = 0
         self.fruit_location = None
+        # nearest pill/fruit distance fields are built on first use, then kept up to date
+        self._pill_field = None
+        self._fruit_field = None
+        # open cells without pills for fruit spawns, built on first use, then kept up to date
+        self._free_cells = None
+        self._fields_shared = False
         self.time = int(self.width*self.height*self.time_multiplier)
+        self.end_time = 0 if self.horizon is None else self.time - int(self.time*self.horizon)
         self.score = 0
         self.bonus = 0
         self.gameover = False
@@ -115,55 +713,154 @@ class GPacGame():
         self.possible_actions = dict()
 
         # initialize new world file log
-        self.log = [f'{self.width}', f'{self.height}']
-        for player, location in self.players.items():
-            self.log.append(f'{player} {location[0]} {location[1]}')
-        for x in range(len(self.map)):
-            for y in range(len(self.map[x])):
-                if self.map[x][y] == 1:
-                    self.log.append(f'w {x} {y}')
-        for x, y in self.pills:
-            self.log.append(f'p {x} {y}')
-        self.log.append(f't {self.time} {self.score}')
+        if self.log_level == 'none':
+            self.log = None
+        else:
+            self.log = GameLog(self.width, self.height, self.players, self.players.values(), self.compiled_map.wall_lines, self.pills, self.time, self.score,
+                               stream=self.log_stream, final_only=self.log_level == 'final')
+
+    @property
+    def pill_field(self):
+        '''DistanceField to the remaining pills, maintained incrementally by step'''
+        if self._pill_field is None:
+            self._pill_field = DistanceField(self.compiled_map, self.pills, self.distance_metric)
+        return self._pill_field
+
+    @property
+    def fruit_field(self):
+        '''DistanceField to the fruit (if any), maintained by step and manage_fruit'''
+        if self._fruit_field is None:
+            fruit = () if self.fruit_location is None else (self.fruit_location,)
+            self._fruit_field = DistanceField(self.compiled_map, fruit, self.distance_metric)
+        return self._fruit_field
+
+    @property
+    def free_cells(self):
+        '''FreeCellIndex of the open cells without pills, maintained by step'''
+        if self._free_cells is None:
+            self._free_cells = FreeCellIndex(self.compiled_map, self.pills)
+        return self._free_cells
+
+    def _own_fields(self):
+        # copy distance fields and the free cell index shared with snapshots before modifying them
+        if self._fields_shared:
+            self._pill_field = None if self._pill_field is None else self._pill_field.copy()
+            self._fruit_field = None if self._fruit_field is None else self._fruit_field.copy()
+            self._free_cells = None if self._free_cells is None else self._free_cells.copy()
+            self._fields_shared = False
+
+    def rng(self, stream):
+        '''random number generator of a stream (see RNG_STREAMS), the random module if the game is unseeded'''
+        rng = self.rngs[stream]
+        return random if rng is None else rng
+
+    def get_rng_state(self):
+        '''state of the random module, or of every stream of a seeded game'''
+        if self.seed is None:
+            return random.getstate()
+        return {stream: rng.getstate() for stream, rng in self.rngs.items()}
+
+    def set_rng_state(self, state):
+        if self.seed is None:
+            random.setstate(state)
+        else:
+            for stream, rng_state in state.items():
+                self.rngs[stream].setstate(rng_state)
+
+    def snapshot(self, capture_rng=True):
+        '''
+        Returns a GPacSnapshot of the current state for restore. The map and
+        settings are not part of it, pills and distance fields are copied
+        on write, the log is only marked (restore rewinds it) and, with
+        capture_rng, the random state (see get_rng_state) is saved.
+        '''
+        self._fields_shared = True
+        return GPacSnapshot(self, capture_rng)
+
+    def restore(self, snapshot, restore_rng=True):
+        '''Returns the game to a snapshot of this game (or of a game on the same map and settings)'''
+        self.players = snapshot.players
+        self.pills = snapshot.pills
+        self.fruit_location = snapshot.fruit_location
+        self.pills_consumed = snapshot.pills_consumed
+        self.fruit_consumed = snapshot.fruit_consumed
+        self.time = snapshot.time
+        self.score = snapshot.score
+        self.bonus = snapshot.bonus
+        self.gameover = snapshot.gameover
+        self.graveyard = set(snapshot.graveyard)
+        self.registered_actions = dict() if snapshot.registered_actions is None else dict(snapshot.registered_actions)
+        self.possible_actions = dict()
+        self._pill_field = snapshot.pill_field
+        self._fruit_field = snapshot.fruit_field
+        self._free_cells = snapshot.free_cells
+        self._fields_shared = True
+        if restore_rng and snapshot.rng_state is not None:
+            self.set_rng_state(snapshot.rng_state)
+        if self.log is not None and snapshot.log_turns is not None:
+            self.log.truncate(snapshot.log_turns)
+
+    def clone(self):
+        '''
+        Returns an independent copy of the game in its current state for
+        lookahead or rollouts. It shares the map and settings, is not logged
+        or instrumented and does not change the random module's state. A
+        seeded game's clone continues from copies of its random streams.
+        '''
+        game = GPacGame.__new__(GPacGame)
+        game.__dict__.update(self.__dict__)
+        for method in ('get_actions', 'get_observations', 'step', 'manage_fruit'):
+            game.__dict__.pop(method, None) # instrumentation wrappers
+        game.log = None
+        game.log_level = 'none'
+        game.log_stream = None
+        game.stats = None
+        if self.seed is not None:
+            game.rngs = {stream: copy_rng(rng) for stream, rng in self.rngs.items()}
+        game.restore(self.snapshot(capture_rng=False))
+        return game
+
+    def nearest_pill_distance(self, location):
+        '''Distance from location to the closest pill (UNREACHABLE if none remain)'''
+        return self.pill_field[location]
+
+    def nearest_fruit_distance(self, location):
+        '''Distance from location to the fruit (UNREACHABLE if there is none)'''
+        return self.fruit_field[location]
 
     def update_score(self):
         self.score = int(100*self.pills_consumed/(self.pills_consumed+len(self.pills))) + self.bonus
 
     def manage_fruit(self):
         # check if fruit already exists and whether or not one should spawn this turn
-        if self.fruit_location == None and random.random() <= self.fruit_prob:
-            forbidden_locations = self.pills | {self.players[player] for player in self.players if 'm' in player}
-            available_locations = list()
-            for x in range(len(self.map)):
-                for y in range(len(self.map[x])):
-                    if self.map[x][y] == 0 and (x, y) not in forbidden_locations:
-                        available_locations.append((x, y))
-
-            if len(available_locations) == 0:
-                self.fruit_location = None
-            else:
-                self.fruit_location = random.choice(available_locations)
+        rng = self.rng('fruit')
+        if self.fruit_location == None and rng.random() <= self.fruit_prob:
+            # uniform over open cells without pills or Pac-Men (None if there are none)
+            self.fruit_location = self.free_cells.sample(exclude={self.players[player] for player in self.pac_players}, rng=rng)
+            if self.fruit_location is not None:
+                if self._fruit_field is not None:
+                    self._own_fields()
+                    self._fruit_field.add(self.fruit_location)
                 # log spawn of fruit
-                self.log.append(f'f {self.fruit_location[0]} {self.fruit_location[1]}')
+                if self.log is not None:
+                    self.log.record_fruit(self.fruit_location)
 
     def get_actions(self, player='m'):
         if player not in self.possible_actions:
-            available_actions = list()
-            if 'm' in player:
-                candidate_actions = PAC_ACTIONS
+            if self.is_pac[player]:
+                legal_moves = self.compiled_map.pac_moves
             else:
-                candidate_actions = GHOST_ACTIONS
-            current_location = self.players[player]
-            for action in candidate_actions:
-                x, y = current_location
-                x_shift, y_shift = PAC_ACTIONS[action]
-                if  0 <= x+x_shift < len(self.map) and 0 <= y+y_shift < len(self.map[x]) and self.map[x+x_shift][y+y_shift] == 0:
-                    available_actions.append(action)
-            self.possible_actions[player] = available_actions
+                legal_moves = self.compiled_map.ghost_moves
+            self.possible_actions[player] = list(legal_moves[self.players[player]])
 
         return self.possible_actions[player]
 
     def get_observations(self, actions, player='m'):
+        '''
+        Returns the state resulting from each action of player. In 'view'
+        mode these are GPacObservation objects sharing the current game
+        state; in 'dict' mode each state is an independent dict.
+        '''
         observations = list()
         current_location = self.players[player]
         fruit_copy = self.fruit_location
@@ -171,8 +868,11 @@ class GPacGame():
             x, y = current_location
             x_shift, y_shift = PAC_ACTIONS[action]
             x, y = x+x_shift, y+y_shift
-            state = {'walls': self.map[:][:], 'pills':list(self.pills), 'fruit':fruit_copy, 'players':self.players.copy()}
-            state['players'][player] = (x, y)
+            if self.observation_mode == 'view':
+                state = GPacObservation(self.map, self.pills, fruit_copy, self.players, player, (x, y))
+            else:
+                state = {'walls': list(self.map), 'pills':list(self.pills), 'fruit':fruit_copy, 'players':self.players.copy()}
+                state['players'][player] = (x, y)
             observations.append(state)
         return observations 
 
@@ -181,7 +881,9 @@ class GPacGame():
 
     def step(self):
         self.time -= 1
-        old_locations = self.players.copy()
+        # players and pills are replaced rather than modified so observations stay valid
+        old_locations = self.players
+        self.players = self.players.copy()
         touched_pills = set()
         touched_fruit = False
         
@@ -191,7 +893,7 @@ class GPacGame():
                 continue # skip deceased pacs
             assert action in self.get_actions(player=player), f'ERROR: INVALID ACTION ({action}) FOR PLAYER {player}'
             x, y = self.players[player]
-            if 'm' in player:
+            if self.is_pac[player]:
                 x_shift, y_shift = PAC_ACTIONS[action]
                 self.players[player] = pac = (x+x_shift, y+y_shift)
                 if pac in self.pills:
@@ -203,91 +905,303 @@ class GPacGame():
         self.registered_actions.clear()
         self.possible_actions.clear()
 
-        # detect collsions between pacs and ghosts
-        pacs = {player for player in self.players if 'm' in player}
-        ghosts = [player for player in self.players if player not in pacs]
-        for pac in pacs:
+        # detect collsions between pacs and ghosts in O(pacs + ghosts): ghost cells are marked
+        # on an occupancy grid for direct collisions and ghost moves are kept for trades
+        occupancy = self._occupancy
+        height = self.height
+        ghost_cells = [x*height+y for x, y in (self.players[ghost] for ghost in self.ghost_players)]
+        for cell in ghost_cells:
+            occupancy[cell] = 1
+        ghost_moves = None
+        for pac in self.pac_players:
             if pac in self.graveyard:
                 continue
+            x, y = location = self.players[pac]
             # detect direct collision
-            if self.players[pac] in {self.players[ghost] for ghost in ghosts}:
+            if occupancy[x*height+y]:
                 self.graveyard.add(pac)
                 continue
             # detect collsion via trading locations
-            for ghost in ghosts:
-                if self.players[pac] == old_locations[ghost] and old_locations[pac] == self.players[ghost]:
-                    self.graveyard.add(pac)
-        
-        if self.graveyard == pacs:
+            if ghost_moves is None:
+                ghost_moves = {(old_locations[ghost], self.players[ghost]) for ghost in self.ghost_players}
+            if (location, old_locations[pac]) in ghost_moves:
+                self.graveyard.add(pac)
+        for cell in ghost_cells:
+            occupancy[cell] = 0
+
+        if len(self.graveyard) == len(self.pac_players):
             self.gameover = True
         else:
             if touched_pills:
-                for pill in touched_pills:
-                    self.pills_consumed += 1
-                    self.pills.remove(pill)
+                self.pills_consumed += len(touched_pills)
+                self.pills = self.pills - touched_pills
+                if self._pill_field is not None or self._free_cells is not None:
+                    self._own_fields()
+                    for pill in touched_pills:
+                        if self._pill_field is not None:
+                            self._pill_field.remove(pill)
+                        if self._free_cells is not None:
+                            self._free_cells.add(pill)
                 self.update_score()
             if touched_fruit:
                 self.fruit_consumed += 1
                 self.fruit_location = None
+                if self._fruit_field is not None:
+                    self._own_fields()
+                    self._fruit_field.clear()
                 self.bonus += self.fruit_score
                 self.update_score()
             if len(self.pills) == 0:
                 self.gameover = True
                 self.bonus += int(100*self.time/int(self.width*self.height*self.time_multiplier))
                 self.update_score()
-            elif self.time <= 0:
+            elif self.time <= self.end_time:
                 self.gameover = True
             
-        # update log
-        for player, location in self.players.items():
-            self.log.append(f'{player} {location[0]} {location[1]}')
         self.manage_fruit() # do things with fruit
-        self.log.append(f't {self.time} {self.score}')
-
-def render_start(log, speed=1):
-    '''A so-so visualization function that renders the first frame of GPac'''
-    width = int(log[0])
-    height = int(log[1])
-    pltmaze = [[1 for __ in range(width)] for _ in range(height)]
-    players = dict()
-    log_idx = 2
-    while log[log_idx][0] != 'w':
-        elements = log[log_idx].split(' ')
-        coords = (int(elements[1]), int(elements[2]))
-        players[elements[0]] = coords
-        log_idx += 1
-
-    while log[log_idx][0] == 'w':
-        elements = log[log_idx].split(' ')
-        x, y = int(elements[1]), int(elements[2])
-        pltmaze[y][x] = 0
-        log_idx += 1
-    pills = set()
-    while log[log_idx][0] == 'p':
-        elements = log[log_idx].split(' ')
-        coords = (int(elements[1]), int(elements[2]))
-        pills.add(coords)
-        log_idx += 1
-    fruit = None
-
-    fig, ax = plt.subplots()
-    ax.matshow(pltmaze, origin='lower')
-
-    temp = list(pills)
-    ax.scatter([i[0] for i in temp], [i[1] for i in temp])
-    
-    temp = [players[player] for player in players if 'm' in player]
-    ax.scatter([i[0] for i in temp], [i[1] for i in temp], 300, marker=PAC_ICON)
-
-    temp = [players[player] for player in players if 'm' not in player]
-    ax.scatter([i[0] for i in temp], [i[1] for i in temp], 300, marker=GHOST_ICON)
-
-    plt.xticks(range(len(pltmaze[0])))
-    plt.yticks(range(len(pltmaze)))
-    plt.gca().set_xticks([x - 0.5 for x in plt.gca().get_xticks()][1:], minor='true')
-    plt.gca().set_yticks([y - 0.5 for y in plt.gca().get_yticks()][1:], minor='true')
-    plt.grid(which='minor')
-    plt.show()
+        # update log
+        if self.log is not None:
+            self.log.record_turn(self.players.values(), self.time, self.score, self.fruit_location)
+            if self.gameover:
+                self.log.close()
+
+# action codes used by the batched engine (index into this list)
+VEC_ACTIONS = list(PAC_ACTIONS)
+
+class VecGPacGame():
+    '''
+    Batched GPac engine that advances num_games independent games in lockstep.
+
+    Player locations, pills, fruit, time and score live in NumPy arrays with
+    one row per game and cells flattened as x*height+y. Rules match GPacGame
+    exactly. Each game draws from its own random.Random seeded from seeds,
+    in the same order GPacGame and play_GPac draw from the global random
+    module, so game i reproduces a scalar game played after
+    random.seed(seeds[i]). With streams, game i instead has the random
+    streams of GPacGame(seed=seeds[i]) (see rng_streams) and reproduces
+    play_GPac(..., seed=seeds[i]). rngs[i] maps stream names to the
+    generators of game i either way. horizon stops games early as in
+    GPacGame.
+    '''
+    def __init__(self, game_map, num_games=1, pill_density=0.1, fruit_prob=0.2, fruit_score=10, time_multiplier=2, num_ghosts=3, num_pacs=1, pill_spawn='stochastic', seeds=None, streams=False, distance_metric='manhattan', horizon=None, **kwargs):
+        if not isinstance(game_map, CompiledMap):
+            game_map = CompiledMap(game_map)
+        self.compiled_map = game_map
+        self.map = game_map.grid
+        self.width = game_map.width
+        self.height = game_map.height
+        self.num_games = num_games
+        self.num_pacs = num_pacs
+        self.players = ['m'] + [f'm{pac}' for pac in range(num_pacs-1)] + [f'{ghost}' for ghost in range(num_ghosts)]
+        self.pill_density = pill_density
+        self.fruit_prob = fruit_prob
+        self.fruit_score = fruit_score
+        self.time_multiplier = time_multiplier
+        self.horizon = horizon
+        self.pill_spawn = pill_spawn
+        self.distance_metric = distance_metric
+        if seeds is None:
+            seeds = [random.getrandbits(64) for _ in range(num_games)]
+        assert len(seeds) == num_games, f"ERROR: EXPECTED {num_games} SEEDS BUT RECEIVED {len(seeds)}"
+        self.seeds = list(seeds)
+        self.streams = streams
+
+        # static map tables shared by every game in the batch
+        self.open = game_map.open
+        self.legal_moves = game_map.move_mask
+        shifts = np.array([PAC_ACTIONS[action] for action in VEC_ACTIONS])
+        self.offsets = shifts[:,0]*self.height + shifts[:,1]
+        self.adjacent_walls = len(GHOST_ACTIONS) - self.legal_moves[:, 1:].sum(axis=1)
+        self._distances = None
+        # per-cell tuples of legal action codes in the order GPacGame.get_actions lists them
+        self.pac_options = [tuple(np.flatnonzero(row)) for row in self.legal_moves]
+        self.ghost_options = [tuple(code for code in options if code != 0) for options in self.pac_options]
+        self.reset()
+
+    def reset(self):
+        num_games, num_players = self.num_games, len(self.players)
+        if self.streams:
+            self.rngs = [rng_streams(seed) for seed in self.seeds]
+        else:
+            self.rngs = [dict.fromkeys(RNG_STREAMS, random.Random(seed)) for seed in self.seeds]
+        # spawn players
+        pac_start = self.height-1
+        ghost_start = (self.width-1)*self.height
+        self.locations = np.full((num_games, num_players), ghost_start, dtype=np.int64)
+        self.locations[:, :self.num_pacs] = pac_start
+
+        placement_strategies = {'stochastic', 'linear', 'manhattan'}
+        assert self.pill_spawn in placement_strategies, f"ERROR: UNRECOGNIZED PILL SPAWN STRATEGY {self.pill_spawn} BUT EXPECTED {placement_strategies}"
+        available = self.open.copy()
+        # like GPacGame, only cells a player spawns on are forbidden (there may be no ghosts)
+        available[np.unique(self.locations[0])] = False
+        available = np.flatnonzero(available)
+        assert len(available) > 0, "ERROR: NO VALID PILL LOCATIONS"
+        self.pills = np.zeros((num_games, self.width*self.height), dtype=bool)
+        # generate pill placement
+        if self.pill_spawn.casefold() == 'stochastic':
+            for game, rngs in enumerate(self.rngs):
+                rng = rngs['pills']
+                rolls = np.array([rng.random() for _ in available])
+                self.pills[game, available[rolls <= self.pill_density]] = True
+                if not self.pills[game].any(): # failsafe logic to guarantee pill placement
+                    self.pills[game, rng.choice(available)] = True
+        else:
+            pill_freq = max(1,int(round(1/self.pill_density)))
+            if self.pill_spawn.casefold() == 'manhattan':
+                available = available[np.argsort(available//self.height + available%self.height, kind='stable')]
+            self.pills[:, available[::pill_freq]] = True
+
+        self.pills_left = self.pills.sum(axis=1)
+        self.pills_consumed = np.zeros(num_games, dtype=np.int64)
+        self.fruit_consumed = np.zeros(num_games, dtype=np.int64)
+        self.fruit_location = np.full(num_games, -1, dtype=np.int64)
+        self.max_time = int(self.width*self.height*self.time_multiplier)
+        self.time = np.full(num_games, self.max_time, dtype=np.int64)
+        self.end_time = 0 if self.horizon is None else self.max_time - int(self.max_time*self.horizon)
+        self.score = np.zeros(num_games, dtype=np.int64)
+        self.bonus = np.zeros(num_games, dtype=np.int64)
+        self.gameover = np.zeros(num_games, dtype=bool)
+        self.dead = np.zeros((num_games, self.num_pacs), dtype=bool)
+
+    def get_actions(self, player=0):
+        '''Returns a tuple of legal action codes per game for the player at index player'''
+        options = self.pac_options if player < self.num_pacs else self.ghost_options
+        return [options[location] for location in self.locations[:, player]]
+
+    @property
+    def distances(self):
+        '''Distances between open cells under distance_metric, indexed by CompiledMap.open_index'''
+        if self._distances is None:
+            if self.distance_metric == 'maze':
+                self._distances = self.compiled_map.distances
+            else:
+                xs, ys = np.divmod(np.flatnonzero(self.open), self.height)
+                self._distances = np.abs(xs[:, None] - xs) + np.abs(ys[:, None] - ys)
+        return self._distances
+
+    def sense(self, player=0):
+        '''
+        Sensor values (G, P, W, F) after each action code of the player at
+        index player, shaped (num_games, len(VEC_ACTIONS), 4) and matching
+        fitness.sense on GPacGame. Rows of illegal actions are meaningless.
+        '''
+        open_index = self.compiled_map.open_index
+        locations = self.locations[:, player, None]
+        targets = np.where(self.legal_moves[locations[:, 0]], locations + self.offsets, locations)
+        rows = self.distances[open_index[targets]] # (games, actions, open cells)
+        sensors = np.full(targets.shape + (4,), UNREACHABLE, dtype=float)
+        ghosts = open_index[self.locations[:, self.num_pacs:]]
+        if ghosts.shape[1] > 0:
+            sensors[..., 0] = np.take_along_axis(rows, np.repeat(ghosts[:, None, :], targets.shape[1], axis=1), axis=2).min(axis=2)
+        pills = self.pills[:, self.open][:, None, :]
+        sensors[..., 1] = np.where(pills, rows, UNREACHABLE).min(axis=2)
+        sensors[..., 2] = self.adjacent_walls[targets]
+        fruit = self.fruit_location >= 0
+        sensors[fruit, :, 3] = rows[fruit, :, open_index[self.fruit_location[fruit]]]
+        return sensors
+
+    def sense_ghost(self, player):
+        '''
+        Ghost sensor values (G, P, W, F) after each action code of the ghost
+        at index player, shaped like sense and matching fitness.sense_ghost:
+        G and P are the distances to the nearest other ghost and living Pac-Man.
+        '''
+        open_index = self.compiled_map.open_index
+        locations = self.locations[:, player, None]
+        targets = np.where(self.legal_moves[locations[:, 0]], locations + self.offsets, locations)
+        rows = self.distances[open_index[targets]] # (games, actions, open cells)
+        sensors = np.full(targets.shape + (4,), UNREACHABLE, dtype=float)
+        others = [idx for idx in range(self.num_pacs, len(self.players)) if idx != player]
+        if others:
+            ghosts = open_index[self.locations[:, others]]
+            sensors[..., 0] = np.take_along_axis(rows, np.repeat(ghosts[:, None, :], targets.shape[1], axis=1), axis=2).min(axis=2)
+        pacs = open_index[self.locations[:, :self.num_pacs]]
+        pac_distances = np.take_along_axis(rows, np.repeat(pacs[:, None, :], targets.shape[1], axis=1), axis=2)
+        sensors[..., 1] = np.where(self.dead[:, None, :], UNREACHABLE, pac_distances).min(axis=2)
+        sensors[..., 2] = self.adjacent_walls[targets]
+        fruit = self.fruit_location >= 0
+        sensors[fruit, :, 3] = rows[fruit, :, open_index[self.fruit_location[fruit]]]
+        return sensors
+
+    def update_score(self, games):
+        consumed = self.pills_consumed[games]
+        self.score[games] = 100*consumed//(consumed + self.pills_left[games]) + self.bonus[games]
+
+    def manage_fruit(self, games):
+        pacs = self.locations[:, :self.num_pacs]
+        for game in np.flatnonzero(games & (self.fruit_location < 0)):
+            rng = self.rngs[game]['fruit']
+            if rng.random() <= self.fruit_prob:
+                available = self.open & ~self.pills[game]
+                available[pacs[game]] = False
+                available = np.flatnonzero(available)
+                if len(available) > 0:
+                    self.fruit_location[game] = rng.choice(available)
+
+    def step(self, actions):
+        '''Advances every unfinished game by one turn given an (num_games, num_players) array of action codes'''
+        actions = np.asarray(actions)
+        active = ~self.gameover
+        rows = np.arange(self.num_games)
+        self.time[active] -= 1
+        old_locations = self.locations.copy()
+
+        # update player locations from registered actions
+        movers = np.repeat(active[:, None], len(self.players), axis=1)
+        movers[:, :self.num_pacs] &= ~self.dead
+        assert self.legal_moves[self.locations[movers], actions[movers]].all(), 'ERROR: INVALID ACTION IN BATCH'
+        assert (actions[:, self.num_pacs:][movers[:, self.num_pacs:]] != 0).all(), 'ERROR: GHOSTS CANNOT HOLD'
+        self.locations[movers] += self.offsets[actions[movers]]
+
+        touched_pills = np.zeros((self.num_games, self.num_pacs), dtype=bool)
+        touched_fruit = np.zeros(self.num_games, dtype=bool)
+        for pac in range(self.num_pacs):
+            location = self.locations[:, pac]
+            moved = movers[:, pac]
+            touched_pills[:, pac] = moved & self.pills[rows, location]
+            for other in range(pac): # pills are a set, so shared cells count once
+                touched_pills[:, pac] &= ~(touched_pills[:, other] & (self.locations[:, other] == location))
+            # GPacGame only credits fruit touched by the last Pac-Man to move
+            touched_fruit = np.where(moved, location == self.fruit_location, touched_fruit)
+
+        # detect collsions between pacs and ghosts
+        ghosts = self.locations[:, self.num_pacs:]
+        old_ghosts = old_locations[:, self.num_pacs:]
+        for pac in range(self.num_pacs):
+            location = self.locations[:, pac:pac+1]
+            old_location = old_locations[:, pac:pac+1]
+            direct = (ghosts == location).any(axis=1)
+            traded = ((old_ghosts == location) & (ghosts == old_location)).any(axis=1)
+            self.dead[:, pac] |= active & (direct | traded)
+
+        all_dead = self.dead.all(axis=1)
+        self.gameover |= active & all_dead
+        alive = active & ~all_dead
+        eaten = touched_pills & alive[:, None]
+        self.pills[rows[:, None].repeat(self.num_pacs, axis=1)[eaten], self.locations[:, :self.num_pacs][eaten]] = False
+        eaten = eaten.sum(axis=1)
+        self.pills_consumed += eaten
+        self.pills_left -= eaten
+        fruit = touched_fruit & alive
+        self.fruit_consumed += fruit
+        self.fruit_location[fruit] = -1
+        self.bonus += fruit*self.fruit_score
+        cleared = alive & (self.pills_left == 0)
+        self.bonus[cleared] += 100*self.time[cleared]//self.max_time
+        self.update_score(alive)
+        self.gameover |= cleared | (alive & (self.time <= self.end_time))
+
+        self.manage_fruit(active) # do things with fruit
+
+# rendering lives in gpac_render, which imports matplotlib on first use
+RENDER_NAMES = {'render_start', 'ReplayRenderer', 'render_replay', 'PAC_ICON', 'GHOST_ICON'}
+
+def __getattr__(name):
+    if name in RENDER_NAMES:
+        import gpac_render
+        return getattr(gpac_render, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # test game with random agents if you run this file
 if __name__ == "__main__":
@@ -300,3 +1214,28 @@ if __name__ == "__main__":
         [game.register_action(random.choice(game.get_actions(player = player)), player = player) for player in game.players]
         game.step()
     [print(line) for line in game.log]
+
+    # unseeded and seeded games can be deepcopied and pickled mid-game
+    import copy, pickle
+    for seed in (None, 0):
+        game = GPacGame(game_map, seed=seed, log_level='none')
+        for _ in range(5):
+            [game.register_action(game.rng('pacs' if 'm' in player else 'ghosts').choice(game.get_actions(player=player)), player=player) for player in game.players]
+            game.step()
+        for duplicate in (copy.deepcopy(game), pickle.loads(pickle.dumps(game))):
+            assert (duplicate.players, duplicate.pills, duplicate.score, duplicate.seed) == (game.players, game.pills, game.score, game.seed), \
+                f"ERROR: COPY OF GAME WITH SEED {seed} DIFFERS FROM THE ORIGINAL"
+    print('GPacGame deepcopies and pickles')
+
+    # a final-state log shows the fruit still on the board, even if it spawned turns before the end
+    for seed in range(100):
+        game = GPacGame(game_map, seed=seed, log_level='final', fruit_prob=0.5)
+        while not game.gameover:
+            [game.register_action(game.rng('pacs' if 'm' in player else 'ghosts').choice(game.get_actions(player=player)), player=player) for player in game.players]
+            game.step()
+        if game.fruit_location is not None:
+            final_turn = list(game.log)[-len(game.players)-2:]
+            assert f'f {game.fruit_location[0]} {game.fruit_location[1]}' in final_turn, f"ERROR: FINAL LOG OF SEED {seed} IS MISSING THE FRUIT"
+            break
+    assert game.fruit_location is not None, "ERROR: NO GAME ENDED WITH A FRUIT ON THE BOARD"
+    print('final-state logs keep the fruit on the board')
@@ -0,0 +1,186 @@
+from copy import deepcopy
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.path as mpath
+from matplotlib import animation
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from game_log import GameLog
+
+# Rendering for gpac, kept apart from the simulation engine so that games
+# (and pool workers) never import matplotlib. gpac re-exports these names
+# and imports this module the first time one is used.
+
+# pac-man icon creation
+pac_vertices = deepcopy(mpath.Path.unit_circle().vertices)
+pac_codes = deepcopy(mpath.Path.unit_circle().codes)
+pac_vertices[5] = [0,0]
+pac_vertices[6] = [0,0]
+pac_vertices[7] = [0,0]
+PAC_ICON = mpath.Path(vertices=pac_vertices,codes=pac_codes)
+# ghost icon creation
+fin_depth = 0.5
+ghost_vertices = deepcopy(mpath.Path.unit_circle().vertices)
+ghost_codes = deepcopy(mpath.Path.unit_circle().codes)
+ghost_vertices[1] = [0.25,-fin_depth]
+ghost_vertices[2] = [0.5, -1]
+ghost_vertices[3] = [0.75, -fin_depth]
+ghost_vertices[4] = [1, -1]
+ghost_vertices[5] = [1, 0]
+ghost_vertices[19] = [-1, -1]
+ghost_vertices[20] = [-0.75, -fin_depth]
+ghost_vertices[21] = [-0.5, -1]
+ghost_vertices[22] = [-0.25, -fin_depth]
+ghost_vertices[23] = [0, -1]
+ghost_codes[1] = 2
+ghost_codes[2] = 2
+ghost_codes[3] = 2
+ghost_codes[4] = 2
+ghost_codes[5] = 2
+ghost_codes[6] = 2
+ghost_codes[19] = 2
+ghost_codes[20] = 2
+ghost_codes[21] = 2
+ghost_codes[22] = 2
+ghost_codes[23] = 2
+GHOST_ICON = mpath.Path(vertices=ghost_vertices,codes=ghost_codes)
+
+def render_start(log, speed=1):
+    '''A so-so visualization function that renders the first frame of GPac'''
+    width = int(log[0])
+    height = int(log[1])
+    pltmaze = [[1 for __ in range(width)] for _ in range(height)]
+    players = dict()
+    log_idx = 2
+    while log[log_idx][0] != 'w':
+        elements = log[log_idx].split(' ')
+        coords = (int(elements[1]), int(elements[2]))
+        players[elements[0]] = coords
+        log_idx += 1
+
+    while log[log_idx][0] == 'w':
+        elements = log[log_idx].split(' ')
+        x, y = int(elements[1]), int(elements[2])
+        pltmaze[y][x] = 0
+        log_idx += 1
+    pills = set()
+    while log[log_idx][0] == 'p':
+        elements = log[log_idx].split(' ')
+        coords = (int(elements[1]), int(elements[2]))
+        pills.add(coords)
+        log_idx += 1
+    fruit = None
+
+    fig, ax = plt.subplots()
+    ax.matshow(pltmaze, origin='lower')
+
+    temp = list(pills)
+    ax.scatter([i[0] for i in temp], [i[1] for i in temp])
+    
+    temp = [players[player] for player in players if 'm' in player]
+    ax.scatter([i[0] for i in temp], [i[1] for i in temp], 300, marker=PAC_ICON)
+
+    temp = [players[player] for player in players if 'm' not in player]
+    ax.scatter([i[0] for i in temp], [i[1] for i in temp], 300, marker=GHOST_ICON)
+
+    plt.xticks(range(len(pltmaze[0])))
+    plt.yticks(range(len(pltmaze)))
+    plt.gca().set_xticks([x - 0.5 for x in plt.gca().get_xticks()][1:], minor='true')
+    plt.gca().set_yticks([y - 0.5 for y in plt.gca().get_yticks()][1:], minor='true')
+    plt.grid(which='minor')
+    plt.show()
+
+class ReplayRenderer():
+    '''
+    Animates a whole game from a log (a GameLog, world file lines, or a path
+    to a text or binary log).
+
+    The log is parsed once into per-turn arrays, including the turn each
+    pill and fruit is eaten. The maze image and the pill, fruit, Pac-Man and
+    ghost artists are created once and only their offsets are updated per
+    frame, so animations can blit. frame_skip renders every n-th turn. With
+    headless, the figure is created without pyplot for exporting with save.
+    '''
+    def __init__(self, log, frame_skip=1, headless=False, icon_size=300):
+        if isinstance(log, str):
+            log = GameLog.load(log)
+        elif not isinstance(log, GameLog):
+            log = GameLog.from_text(log)
+        self.log = log
+        records = log.records
+        self.locations = records['locations'].astype(int)
+        self.time = records['time']
+        self.score = records['score']
+        self.frame_skip = frame_skip
+        is_pac = np.array(['m' in player for player in log.players])
+        self.pac_columns = np.flatnonzero(is_pac)
+        self.ghost_columns = np.flatnonzero(~is_pac)
+
+        # turn on which each pill/fruit is first reached by a Pac-Man
+        num_turns = len(records)
+        pac_cells = self.locations[:, self.pac_columns, 0]*log.height + self.locations[:, self.pac_columns, 1]
+        first_visit = np.full(log.width*log.height, num_turns)
+        for turn in range(num_turns-1, -1, -1):
+            first_visit[pac_cells[turn]] = turn
+        self.pills = log.pills.astype(int)
+        self.pill_eaten = first_visit[self.pills[:, 0]*log.height + self.pills[:, 1]] if len(self.pills) else np.zeros(0, dtype=int)
+        self.fruit = list() # (spawn turn, eaten turn, location)
+        for spawn, x, y in log.fruit_events:
+            visits = np.flatnonzero((pac_cells[spawn+1:] == x*log.height + y).any(axis=1))
+            self.fruit.append((spawn, spawn+1+visits[0] if len(visits) else num_turns, (x, y)))
+
+        maze = np.ones((log.height, log.width))
+        for line in log.wall_lines:
+            _, x, y = line.split(' ')
+            maze[int(y), int(x)] = 0
+        if headless:
+            self.figure = Figure()
+            FigureCanvasAgg(self.figure)
+            self.axes = self.figure.add_subplot()
+        else:
+            self.figure, self.axes = plt.subplots()
+        self.axes.matshow(maze, origin='lower')
+        self.axes.set_xticks([x - 0.5 for x in range(1, log.width)], minor=True)
+        self.axes.set_yticks([y - 0.5 for y in range(1, log.height)], minor=True)
+        self.axes.grid(which='minor')
+        self.axes.set_xlim(-0.5, log.width-0.5)
+        self.axes.set_ylim(-0.5, log.height-0.5)
+        empty = np.zeros((0, 2))
+        self.pill_artist = self.axes.scatter(empty[:, 0], empty[:, 1], animated=True)
+        self.fruit_artist = self.axes.scatter(empty[:, 0], empty[:, 1], 150, marker='*', color='red', animated=True)
+        self.pac_artist = self.axes.scatter(empty[:, 0], empty[:, 1], icon_size, marker=PAC_ICON, color='yellow', animated=True)
+        self.ghost_artist = self.axes.scatter(empty[:, 0], empty[:, 1], icon_size, marker=GHOST_ICON, animated=True)
+        self.text_artist = self.axes.set_title('', animated=True)
+        self.artists = (self.pill_artist, self.fruit_artist, self.pac_artist, self.ghost_artist, self.text_artist)
+
+    @property
+    def frames(self):
+        '''turns that are rendered, always including the last one'''
+        frames = list(range(0, len(self.time), self.frame_skip))
+        if frames[-1] != len(self.time)-1:
+            frames.append(len(self.time)-1)
+        return frames
+
+    def update(self, turn):
+        '''moves every artist to its state at turn and returns the artists to redraw'''
+        self.pill_artist.set_offsets(self.pills[self.pill_eaten > turn].reshape(-1, 2))
+        fruit = [location for spawn, eaten, location in self.fruit if spawn <= turn < eaten]
+        self.fruit_artist.set_offsets(np.array(fruit).reshape(-1, 2))
+        self.pac_artist.set_offsets(self.locations[turn, self.pac_columns])
+        self.ghost_artist.set_offsets(self.locations[turn, self.ghost_columns])
+        self.text_artist.set_text(f'turn {turn}  time {self.time[turn]}  score {self.score[turn]}')
+        return self.artists
+
+    def animate(self, interval=50):
+        '''Returns a blitted matplotlib FuncAnimation of the game'''
+        return animation.FuncAnimation(self.figure, self.update, frames=self.frames, init_func=lambda: self.update(0),
+                                       blit=True, interval=interval)
+
+    def save(self, filename, fps=20):
+        '''Exports the animation to filename (.gif via Pillow, otherwise ffmpeg)'''
+        writer = animation.PillowWriter(fps=fps) if filename.endswith('.gif') else animation.FFMpegWriter(fps=fps)
+        self.animate().save(filename, writer=writer)
+
+def render_replay(log, frame_skip=1, interval=50):
+    '''Animates a whole game in a notebook or window (see ReplayRenderer)'''
+    return ReplayRenderer(log, frame_skip=frame_skip).animate(interval=interval)
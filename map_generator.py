@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+
+# use: python3 map_generator.py width height output_file [--loops 0.1] [--seed 0]
+# use note: output files use the maps/ format and load with gpac.parse_map
+
+import argparse
+import random
+
+
+def generate_maze(width, height, loops=0.1, rng=random):
+    '''
+    Procedural maze in parse_map orientation (game_map[x][y], 0 open, 1 wall).
+    A randomized depth-first search carves a perfect maze through the cells at
+    even coordinates, then each wall between two corridors is opened with
+    probability loops so there are cycles to escape ghosts through. The
+    Pac-Man (top left) and ghost (bottom right) spawn cells are always open
+    and connected.
+    '''
+    assert width >= 2 and height >= 2, "ERROR: MAZES MUST BE AT LEAST 2x2"
+    game_map = [[1 for _ in range(height)] for _ in range(width)]
+    game_map[0][0] = 0
+    stack = [(0, 0)]
+    # iterative so large mazes do not hit the recursion limit
+    while stack:
+        x, y = stack[-1]
+        neighbors = [(x+dx, y+dy) for dx, dy in ((0, 2), (2, 0), (0, -2), (-2, 0))
+                     if 0 <= x+dx < width and 0 <= y+dy < height and game_map[x+dx][y+dy] == 1]
+        if not neighbors:
+            stack.pop()
+            continue
+        next_x, next_y = rng.choice(neighbors)
+        game_map[(x+next_x)//2][(y+next_y)//2] = 0
+        game_map[next_x][next_y] = 0
+        stack.append((next_x, next_y))
+
+    # braid: open walls that separate two corridors in a straight line
+    for x in range(width):
+        for y in range(1 - x % 2, height, 2): # cells with exactly one odd coordinate separate two cells
+            if game_map[x][y] == 0:
+                continue
+            horizontal = 0 < x < width-1 and game_map[x-1][y] == 0 and game_map[x+1][y] == 0
+            vertical = 0 < y < height-1 and game_map[x][y-1] == 0 and game_map[x][y+1] == 0
+            if (horizontal or vertical) and rng.random() < loops:
+                game_map[x][y] = 0
+
+    # with an even width or height the last column or row holds no cells, so the spawn corners are
+    # opened next to the maze cell beside them
+    game_map[0][height-1] = game_map[0][height-2 + height % 2] = 0
+    game_map[width-1][0] = game_map[width-2 + width % 2][0] = 0
+    return game_map
+
+def format_map(game_map):
+    '''lines of the maps/ file format for game_map (first line "width height", then rows from the top)'''
+    width, height = len(game_map), len(game_map[0])
+    lines = [f'{width} {height}']
+    for y in range(height-1, -1, -1):
+        lines.append(''.join('~' if game_map[x][y] == 0 else '#' for x in range(width)))
+    return lines
+
+def write_map(game_map, filename):
+    with open(filename, 'w') as file:
+        file.write('\n'.join(format_map(game_map)) + '\n')
+
+def main():
+    parser = argparse.ArgumentParser(description='generate a procedural maze in the maps/ file format')
+    parser.add_argument('width', type=int)
+    parser.add_argument('height', type=int)
+    parser.add_argument('output_file')
+    parser.add_argument('--loops', type=float, default=0.1, help='probability of opening each wall between two corridors')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    game_map = generate_maze(args.width, args.height, loops=args.loops, rng=random.Random(args.seed))
+    write_map(game_map, args.output_file)
+    open_cells = sum(cell == 0 for column in game_map for cell in column)
+    print(f'wrote {args.width}x{args.height} maze with {open_cells} open cells to {args.output_file}')
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,82 @@
 import random
+import numpy as np
+
+# Selection operators read every fitness into a NumPy array once, make their
+# random draws in batches and return individuals by index. Draws come from
+# rng (a numpy Generator) or, by default, from a generator seeded by the
+# global random module, so random.seed() keeps runs reproducible.
+
+def get_rng(rng=None):
+    return np.random.default_rng(random.getrandbits(64)) if rng is None else rng
+
+def fitness_array(population):
+    return np.fromiter((individual.fitness for individual in population), dtype=float, count=len(population))
+
+def proportional_weights(fitnesses):
+    '''non-negative selection weights: fitness shifted so the worst is 0 if any is negative, uniform if all are equal'''
+    weights = fitnesses - fitnesses.min() if fitnesses.min() < 0 else fitnesses.copy()
+    if not weights.sum() > 0:
+        weights = np.ones_like(fitnesses)
+    return weights
+
+def pick(population, indices):
+    return [population[idx] for idx in indices]
 
 # Parent selection functions---------------------------------------------------
-def uniform_random_selection(population, n, **kwargs):
-    # TODO: select n individuals uniform randomly
-    pass
+def uniform_random_selection(population, n, rng=None, **kwargs):
+    # select n individuals uniform randomly
+    return pick(population, get_rng(rng).integers(len(population), size=n))
 
-def k_tournament_with_replacement(population, n, k, **kwargs):
-    # TODO: perform n k-tournaments with replacement to select n individuals
-    pass
+def k_tournament_with_replacement(population, n, k, rng=None, **kwargs):
+    # perform n k-tournaments with replacement to select n individuals
+    fitnesses = fitness_array(population)
+    contestants = get_rng(rng).integers(len(population), size=(n, k))
+    winners = contestants[np.arange(n), fitnesses[contestants].argmax(axis=1)]
+    return pick(population, winners)
 
-def fitness_proportionate_selection(population, n, **kwargs):
-    # TODO: select n individuals using fitness proportionate selection
-    pass
+def fitness_proportionate_selection(population, n, rng=None, **kwargs):
+    # select n individuals using fitness proportionate selection
+    cumulative = np.cumsum(proportional_weights(fitness_array(population)))
+    draws = get_rng(rng).random(n)*cumulative[-1]
+    return pick(population, np.minimum(np.searchsorted(cumulative, draws, side='right'), len(population)-1))
 
 
 # Survival selection functions-------------------------------------------------
 def truncation(population, n, **kwargs):
-    # TODO: perform truncation selection to select n individuals
-    pass
+    # perform truncation selection to select n individuals
+    if n >= len(population):
+        return list(population)
+    fitnesses = fitness_array(population)
+    best = np.argpartition(-fitnesses, n-1)[:n]
+    return pick(population, best[np.argsort(-fitnesses[best], kind='stable')])
 
-def k_tournament_without_replacement(population, n, k, **kwargs):
-    # TODO: perform n k-tournaments without replacement to select n individuals
+def k_tournament_without_replacement(population, n, k, rng=None, **kwargs):
+    # perform n k-tournaments without replacement to select n individuals
     #       Note: an individual should never be cloned from surviving twice!
-    pass
+    # Tournaments run in rounds: every tournament still needed is drawn at
+    # once from the individuals that have not won yet, and when several pick
+    # the same winner only one counts and the rest are rerun next round.
+    rng = get_rng(rng)
+    fitnesses = fitness_array(population)
+    remaining = np.arange(len(population))
+    winners = list()
+    while len(winners) < n and len(remaining) > n - len(winners):
+        contestants = remaining[rng.integers(len(remaining), size=(n - len(winners), k))]
+        round_winners = np.unique(contestants[np.arange(len(contestants)), fitnesses[contestants].argmax(axis=1)])
+        winners.extend(round_winners.tolist())
+        remaining = np.setdiff1d(remaining, round_winners, assume_unique=True)
+    if len(winners) < n:
+        winners.extend(remaining.tolist())
+    return pick(population, winners)
 
 # Yellow deliverable parent selection function---------------------------------
-def stochastic_universal_sampling(population, n, **kwargs):
+def stochastic_universal_sampling(population, n, rng=None, **kwargs):
     # Recall that yellow deliverables are required for students in the grad
     # section but bonus for those in the undergrad section.
-    # TODO: select n individuals using stochastic universal sampling
-    pass
+    # select n individuals using stochastic universal sampling
+    rng = get_rng(rng)
+    cumulative = np.cumsum(proportional_weights(fitness_array(population)))
+    pointers = (rng.random() + np.arange(n))*(cumulative[-1]/n)
+    selected = np.searchsorted(cumulative, pointers, side='right')
+    # shuffle so consecutive parents are not neighbours on the wheel
+    return pick(population, np.minimum(rng.permutation(selected), len(population)-1))
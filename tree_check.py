@@ -3,10 +3,16 @@
 # author: Deacon Seals
 
 # use: python3 treeCheck.py treeFilePath0 treeFilePath1 ... treeFilePathN
+# use: python3 tree_check.py [--workers N] [--quiet] treeFilePath0 ... treeFilePathN
 # use note: Bash regex filename expressions supported
 
 import sys
 import re # python regex library
+import argparse
+import multiprocessing
+
+SENSORS = {"G", "P", "W", "F"}
+OPERATORS = {"+":2, "-":2, "*":2, "/":2, "RAND":2}
 
 
 def get_depth(line):
@@ -27,77 +33,149 @@ def num_children(depths, line_num):
             break
     return children
 
+# identified sensor nodes
+def is_sensor(value):
+    return value in SENSORS or re.fullmatch('(-?[0-9]+(\.[0-9]*)?)', value)
+
 '''
-desc:   Checks tree file at input `filepath` for a valid tree. Considers formatting errors
-        that cause tree depth to increase by unreasonable amounts, the number of children
-        each node has. A comment is made for each instance of an unknown node, but this 
-        does not indicate an error if the node is a new sensor or operator you have added
-        and documented.
+desc:   Single pass over the lines of a tree that returns the depth and number of children
+        of every line (as num_children would count them) along with every invalid depth
+        increase. Open ancestors are kept on a stack, so this is O(n) in tree size.
 '''
-def check_tree(filename):
-    sensors = {"G", "P", "W", "F"}
-    operators = {"+":2, "-":2, "*":2, "/":2, "RAND":2}
-
-    # identified sensor nodes
-    def is_sensor(value):
-        numbers = value.split(".")
-        return value in sensors or re.fullmatch('(-?[0-9]+(\.[0-9]*)?)', value)
+def parse_tree(tree_text):
+    depths = []
+    nodes = []
+    children = []
+    depth_errors = []
+    ancestors = [] # line numbers of the nodes still open above the current line
+    for line_num, line in enumerate(tree_text):
+        node = line.lstrip("|")
+        depth = len(line) - len(node)
+        if line_num > 0 and depth - depths[-1] > 1:
+            depth_errors.append("depth increased by more than 1 between lines " \
+                                + repr(line_num) + " and " + repr(line_num+1))
+        # a line at depth d closes every open node at depth d or deeper
+        while ancestors and depths[ancestors[-1]] >= depth:
+            ancestors.pop()
+        if ancestors and depths[ancestors[-1]] == depth-1:
+            children[ancestors[-1]] += 1
+        ancestors.append(line_num)
+        depths.append(depth)
+        nodes.append(node)
+        children.append(0)
+    return depths, nodes, children, depth_errors
 
-    errors = []
-    tree_text = []
-
-    with open(filename, 'r') as file:
-        tree_text = [line.rstrip() for line in file] # remove tailing space from each line
-    # remove tailing blank lines from file
-    for line in range(len(tree_text)):
-        if tree_text[-(line+1)]:
-            if line > 0:
-                tree_text = tree_text[:-line]
-            break
+'''
+desc:   Checks the lines of a tree and returns a dict with the number of nodes, the tree
+        depth, and lists of errors and warnings (the messages check_tree prints).
+'''
+def check_tree_text(tree_text):
+    tree_text = [line.rstrip() for line in tree_text] # remove tailing space from each line
+    # remove tailing blank lines (like the original checker, a file of only blank lines is kept
+    # and checked as is, so its blank lines are reported as unknown nodes)
+    if any(tree_text):
+        while not tree_text[-1]:
+            tree_text.pop()
+    result = {"nodes": len(tree_text), "depth": 0, "errors": [], "warnings": [], "empty": not tree_text}
     if not tree_text:
-        print(filename + ": [ERROR] is empty")
-        return
-
-    depths = [get_depth(line) for line in tree_text]
-    nodes = [line.lstrip("|") for line in tree_text]
-    children = [num_children(depths, line) for line in range(len(tree_text))]
-
-    # check for invalid depth increases
-    for line in range(len(tree_text)-1):
-        if depths[line+1]-depths[line] > 1:
-            errors.append("depth increased by more than 1 between lines " \
-                            + repr(line+1) + " and " + repr(line+2))
-    
-    # somewhat abusive way of breaking if we've already found errors
-    if [print(filename + ": [ERROR] " + error) for error in errors]: return
+        result["errors"].append("is empty")
+        return result
+
+    depths, nodes, children, depth_errors = parse_tree(tree_text)
+    result["depth"] = max(depths)
+    if depth_errors:
+        result["errors"] = depth_errors
+        return result
 
     for line in range(len(tree_text)):
         node = nodes[line]
         num_kids = children[line]
         if is_sensor(node): # sensor
             if num_kids != 0: # sensor has children but shouldn't
-                errors.append("sensor node " + repr(node) + " on line " + repr(line+1) \
+                result["errors"].append("sensor node " + repr(node) + " on line " + repr(line+1) \
                                 + " has " + repr(num_kids) + " more children than it should")
-        elif node in operators: # operators
-            if num_kids != operators[node]: # defined operator has incorrect number of children
-                errors.append("operator node " + repr(node) + " on line " + repr(line+1) \
+        elif node in OPERATORS: # operators
+            if num_kids != OPERATORS[node]: # defined operator has incorrect number of children
+                result["errors"].append("operator node " + repr(node) + " on line " + repr(line+1) \
                                 + " has " + repr(num_kids) + " children but " + \
-                                repr(operators[node]) + " were expected")
+                                repr(OPERATORS[node]) + " were expected")
         else: # unknown node
-            print(filename + ": [warning] unknown node " + repr(node) + " on line " \
+            result["warnings"].append("unknown node " + repr(node) + " on line " \
                             + repr(line+1) + " has " + repr(num_kids) + " children")
+    return result
+
+'''
+desc:   Checks tree file at input `filepath` for a valid tree and returns the structured
+        result of check_tree_text with the filename added.
+'''
+def check_tree_file(filename):
+    with open(filename, 'r') as file:
+        result = check_tree_text(file.read().splitlines())
+    result["filename"] = filename
+    return result
+
+'''
+desc:   Returns the lines check_tree prints for a result of check_tree_file.
+'''
+def format_result(result):
+    filename = result["filename"]
+    lines = [filename + ": [warning] " + warning for warning in result["warnings"]]
+    lines += [filename + ": [ERROR] " + error for error in result["errors"]]
+    if not result["errors"]:
+        lines.append(filename + ": PASS")
+    return lines
 
-    # print errors or pass
-    if not [print(filename + ": [ERROR] " + error) for error in errors]: # still a little hacky
-        print(filename + ": PASS")
+'''
+desc:   Checks tree file at input `filepath` for a valid tree. Considers formatting errors
+        that cause tree depth to increase by unreasonable amounts, the number of children
+        each node has. A comment is made for each instance of an unknown node, but this
+        does not indicate an error if the node is a new sensor or operator you have added
+        and documented.
+'''
+def check_tree(filename):
+    for line in format_result(check_tree_file(filename)):
+        print(line)
     return
 
+'''
+desc:   Checks every file using a pool of worker processes (in this process if workers is 1)
+        and returns the results in the order of filenames.
+'''
+def check_trees(filenames, workers=None):
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers <= 1 or len(filenames) <= 1:
+        return [check_tree_file(filename) for filename in filenames]
+    with multiprocessing.Pool(workers) as pool:
+        return pool.map(check_tree_file, filenames, chunksize=max(1, len(filenames)//(8*workers)))
+
+def summarize(results):
+    passed = sum(1 for result in results if not result["errors"])
+    empty = sum(1 for result in results if result["empty"])
+    warnings = sum(len(result["warnings"]) for result in results)
+    largest = max((result["nodes"] for result in results), default=0)
+    deepest = max((result["depth"] for result in results), default=0)
+    return f"{len(results)} files: {passed} passed, {len(results)-passed} failed ({empty} empty), " \
+           + f"{warnings} warnings, largest tree {largest} nodes, deepest tree {deepest}"
+
 def main():
     if len(sys.argv) < 2:
         print("Please pass in a world file")
-    else:
-        for arg in range(1, len(sys.argv)):
-            check_tree(sys.argv[arg])
+        return 0
+    parser = argparse.ArgumentParser(description="check tree files for valid trees")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (all cores by default)")
+    parser.add_argument("--quiet", action="store_true", help="only print files with warnings or errors")
+    args = parser.parse_args()
+
+    results = check_trees(args.files, args.workers)
+    for result in results:
+        if not args.quiet or result["errors"] or result["warnings"]:
+            for line in format_result(result):
+                print(line)
+    if len(results) > 1:
+        print(summarize(results))
+    return 1 if any(result["errors"] for result in results) else 0
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
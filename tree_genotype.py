@@ -1,43 +1,401 @@
+import random
+import hashlib
+from collections.abc import Sequence
+from math import inf, nan
+import numpy as np
 
 # GPac primitives
 # internal_nodes = {'+','-','*','/','RAND'}
 # leaf_nodes = {'G','P','W','F','#.#'}
+OPERATORS = ('+', '-', '*', '/', 'RAND')
+SENSORS = ('G', 'P', 'W', 'F')
+CONSTANT_RANGE = (-10, 10)
+
+# opcodes of PrefixGene: index into PRIMITIVES, or CONSTANT for numeric leaves
+PRIMITIVES = OPERATORS + SENSORS
+CONSTANT = len(PRIMITIVES)
+OPCODES = {primitive: opcode for opcode, primitive in enumerate(PRIMITIVES)}
+
+def ends_dtype(length):
+    '''smallest unsigned dtype that holds subtree ends of a gene with length nodes'''
+    return np.uint16 if length < 2**16 else np.uint32
+
+# code templates for compiled trees: one per backend, operands are substituted for {a} and {b}
+PYTHON_TEMPLATES = {
+    '+': '{a} + {b}',
+    '-': '{a} - {b}',
+    '*': '{a} * {b}',
+    '/': '({a} / {b} if {b} else 1.0)', # protected division
+    'RAND': '{a} + ({b} - {a}) * _random()',
+}
+NUMPY_TEMPLATES = {
+    '+': '{a} + {b}',
+    '-': '{a} - {b}',
+    '*': '{a} * {b}',
+    '/': '_divide({a}, {b})',
+    'RAND': '{a} + ({b} - {a}) * _draws[:, {draw}]',
+}
+
+def is_operator(primitive):
+    return isinstance(primitive, str) and primitive in OPERATORS
+
+def random_terminal():
+    if random.random() < 1/(len(SENSORS)+1):
+        return round(random.uniform(*CONSTANT_RANGE), 2)
+    return random.choice(SENSORS)
+
+def full(depth_limit, depth=0):
+    '''prefix-order gene of a tree whose every branch reaches depth_limit'''
+    if depth >= depth_limit:
+        return [random_terminal()]
+    return [random.choice(OPERATORS)] + full(depth_limit, depth+1) + full(depth_limit, depth+1)
+
+def grow(depth_limit, depth=0):
+    '''prefix-order gene of a tree whose branches may stop before depth_limit'''
+    if depth >= depth_limit or random.random() < (len(SENSORS)+1)/(len(SENSORS)+1+len(OPERATORS)):
+        return [random_terminal()]
+    return [random.choice(OPERATORS)] + grow(depth_limit, depth+1) + grow(depth_limit, depth+1)
+
+class PrefixGene(Sequence):
+    '''
+    Compact prefix-order tree that reads as the list of its primitives.
+
+    opcodes holds one uint8 per node (see OPCODES and CONSTANT), constants
+    the values of the numeric leaves in prefix order and ends, for every
+    node, the index one past the end of its subtree (see ends_dtype). Replacing a subtree
+    (see splice) only slices and concatenates these arrays.
+    '''
+    __slots__ = ('opcodes', 'constants', 'ends')
+
+    def __init__(self, opcodes, constants, ends):
+        self.opcodes = opcodes
+        self.constants = constants
+        self.ends = ends
+
+    @classmethod
+    def from_primitives(cls, primitives):
+        '''Builds the gene of a prefix-order list of primitives (operator and sensor strings, numbers)'''
+        opcodes = [OPCODES[primitive] if isinstance(primitive, str) else CONSTANT for primitive in primitives]
+        constants = [float(primitive) for primitive in primitives if not isinstance(primitive, str)]
+        ends = [0]*len(opcodes)
+        stack = list() # ends of the subtrees to the right, nearest on top
+        for idx in range(len(opcodes)-1, -1, -1):
+            if opcodes[idx] < len(OPERATORS):
+                assert len(stack) >= 2, f"ERROR: OPERATOR {PRIMITIVES[opcodes[idx]]} AT NODE {idx} IS MISSING CHILDREN"
+                stack.pop()
+                ends[idx] = stack[-1]
+            else:
+                ends[idx] = idx + 1
+                stack.append(idx + 1)
+        assert len(stack) == 1, f"ERROR: PRIMITIVES FORM {len(stack)} TREES INSTEAD OF 1"
+        return cls(np.array(opcodes, dtype=np.uint8), np.array(constants, dtype=float), np.array(ends, dtype=ends_dtype(len(ends))))
+
+    @classmethod
+    def from_text(cls, text):
+        '''Parses the |-depth format of to_text (as checked by tree_check.py)'''
+        lines = [line.rstrip() for line in text.splitlines() if line.strip()]
+        tokens = [line.lstrip('|') for line in lines]
+        gene = cls.from_primitives([token if token in OPCODES else float(token) for token in tokens])
+        depths = [len(line) - len(token) for line, token in zip(lines, tokens)]
+        assert depths == gene.depths().tolist(), "ERROR: NODE DEPTHS DO NOT MATCH THE TREE STRUCTURE"
+        return gene
+
+    def depths(self):
+        '''depth of every node (the root is 0)'''
+        depths = np.zeros(len(self.opcodes), dtype=np.int32)
+        open_ends = list() # subtree ends of the ancestors of the current node
+        for idx, end in enumerate(self.ends.tolist()):
+            while open_ends and open_ends[-1] <= idx:
+                open_ends.pop()
+            depths[idx] = len(open_ends)
+            if end > idx + 1:
+                open_ends.append(end)
+        return depths
+
+    def heights(self):
+        '''height of the subtree at every node (0 for leaves)'''
+        heights = np.zeros(len(self.opcodes), dtype=np.int32)
+        ends = self.ends.tolist()
+        for idx in range(len(ends)-1, -1, -1):
+            if ends[idx] > idx + 1: # operators have their children at idx+1 and the end of its subtree
+                heights[idx] = 1 + max(heights[idx+1], heights[ends[idx+1]])
+        return heights
+
+    def to_text(self):
+        '''one node per line in prefix order, prefixed by a | per level of depth'''
+        return '\n'.join('|'*depth + str(primitive) for depth, primitive in zip(self.depths().tolist(), self))
+
+    def constant_index(self, idx):
+        '''position in constants of the first numeric leaf at or after node idx'''
+        return int(np.count_nonzero(self.opcodes[:idx] == CONSTANT))
+
+    def splice(self, start, donor, donor_start=0):
+        '''Returns a copy with the subtree at start replaced by donor's subtree at donor_start'''
+        end, donor_end = int(self.ends[start]), int(donor.ends[donor_start])
+        shift = (donor_end - donor_start) - (end - start)
+        ends = np.concatenate((self.ends[:start], donor.ends[donor_start:donor_end], self.ends[end:])).astype(np.int64)
+        # ancestors of the replaced subtree end after it and move with the tail
+        ends[:start][ends[:start] > start] += shift
+        ends[start:start + donor_end - donor_start] += start - donor_start
+        ends[start + donor_end - donor_start:] += shift
+        opcodes = np.concatenate((self.opcodes[:start], donor.opcodes[donor_start:donor_end], self.opcodes[end:]))
+        constant_start, constant_end = self.constant_index(start), self.constant_index(end)
+        donor_constant_start = donor.constant_index(donor_start)
+        donor_constant_end = donor_constant_start + int(np.count_nonzero(donor.opcodes[donor_start:donor_end] == CONSTANT))
+        constants = np.concatenate((self.constants[:constant_start], donor.constants[donor_constant_start:donor_constant_end],
+                                    self.constants[constant_end:]))
+        return PrefixGene(opcodes, constants, ends.astype(ends_dtype(len(ends))))
+
+    def primitives(self):
+        '''the prefix-order list of primitives'''
+        primitives = [PRIMITIVES[opcode] if opcode < CONSTANT else None for opcode in self.opcodes.tolist()]
+        for idx, value in zip(np.flatnonzero(self.opcodes == CONSTANT).tolist(), self.constants.tolist()):
+            primitives[idx] = value
+        return primitives
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.primitives()[idx]
+        if self.opcodes[idx] < CONSTANT:
+            return PRIMITIVES[self.opcodes[idx]]
+        return float(self.constants[self.constant_index(idx % len(self.opcodes))])
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def __iter__(self):
+        return iter(self.primitives())
+
+    def __reversed__(self):
+        return reversed(self.primitives())
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f'PrefixGene({self.primitives()})'
+
+    @property
+    def nbytes(self):
+        return self.opcodes.nbytes + self.constants.nbytes + self.ends.nbytes
+
+def pack_genes(genes):
+    '''Concatenates PrefixGenes into a dict of flat arrays (e.g. for np.savez, see unpack_genes)'''
+    return {'opcodes': np.concatenate([gene.opcodes for gene in genes] or [np.zeros(0, dtype=np.uint8)]),
+            'constants': np.concatenate([gene.constants for gene in genes] or [np.zeros(0)]),
+            'gene_lengths': np.array([len(gene.opcodes) for gene in genes], dtype=np.int64),
+            'constant_counts': np.array([len(gene.constants) for gene in genes], dtype=np.int64)}
+
+def unpack_genes(packed):
+    '''Splits the arrays of pack_genes back into PrefixGenes (subtree ends are recomputed)'''
+    if len(packed['gene_lengths']) == 0:
+        return list()
+    opcodes = np.split(packed['opcodes'], np.cumsum(packed['gene_lengths'])[:-1])
+    constants = np.split(packed['constants'], np.cumsum(packed['constant_counts'])[:-1])
+    genes = list()
+    for gene_opcodes, gene_constants in zip(opcodes, constants):
+        primitives = [PRIMITIVES[opcode] if opcode < CONSTANT else None for opcode in gene_opcodes.tolist()]
+        for idx, value in zip(np.flatnonzero(gene_opcodes == CONSTANT).tolist(), gene_constants.tolist()):
+            primitives[idx] = value
+        genes.append(PrefixGene.from_primitives(primitives))
+    return genes
+
+def compile_gene(gene, vectorized=False):
+    '''
+    Compiles a prefix-order gene (a PrefixGene or list of primitives) into a flat function evaluate(sensors, rng)
+    that scores a batch of (G, P, W, F) sensor rows in one call. The tree is
+    unrolled into straight-line code with one assignment per operator, which
+    loops over rows in plain Python or, with vectorized, operates on whole
+    NumPy columns. NaN scores are reported as -inf.
+
+    Both draw one rng.random() per RAND node and row in the same order (row
+    by row, nodes in evaluation order), so they score identically under
+    the same rng: the vectorized evaluator draws the whole (rows, RAND
+    nodes) block up front.
+    '''
+    templates = NUMPY_TEMPLATES if vectorized else PYTHON_TEMPLATES
+    lines = list()
+    stack = list()
+    draws = 0 # RAND nodes emitted so far
+    # evaluate the prefix expression right to left so children are emitted before parents
+    for primitive in reversed(gene):
+        if is_operator(primitive):
+            a, b = stack.pop(), stack.pop()
+            lines.append(f't{len(lines)} = ' + templates[primitive].format(a=a, b=b, draw=draws))
+            draws += primitive == 'RAND'
+            stack.append(f't{len(lines)-1}')
+        elif isinstance(primitive, str):
+            stack.append(primitive)
+        else:
+            stack.append(repr(float(primitive)))
+    result = stack.pop()
+
+    if vectorized:
+        body = ['sensors = np.asarray(sensors, dtype=float).reshape(-1, 4)',
+                'G, P, W, F = sensors.T',
+                f'_draws = np.array([rng.random() for _ in range(len(sensors)*{draws})]).reshape(len(sensors), {draws})',
+                'with np.errstate(all="ignore"):']
+        body += [f'    {line}' for line in lines]
+        body += [f'    scores = np.broadcast_to(np.asarray({result}, dtype=float), len(sensors)).copy()',
+                 'scores[np.isnan(scores)] = -inf',
+                 'return scores']
+    else:
+        body = ['_random = rng.random', 'scores = list()', 'for G, P, W, F in sensors:']
+        body += [f'    {line}' for line in lines]
+        body += [f'    scores.append({result} if {result} == {result} else -inf)', 'return scores']
+    source = 'def evaluate(sensors, rng=random):\n' + '\n'.join(f'    {line}' for line in body)
+    namespace = {'random': random, 'np': np, 'inf': inf, 'nan': nan, '_divide': protected_divide}
+    exec(compile(source, '<tree>', 'exec'), namespace)
+    return namespace['evaluate']
+
+def fold_constants(operator, a, b):
+    '''value of operator applied to constants, computed exactly as compiled trees do'''
+    if operator == '+':
+        return a + b
+    if operator == '-':
+        return a - b
+    if operator == '*':
+        return a * b
+    return a / b if b else 1.0
+
+def canonical_form(gene):
+    '''
+    Returns (canonical gene, canonical hash) for a prefix-order gene (of the
+    same type: PrefixGene or list of primitives). The
+    canonical gene plays exactly like the original: operators on two
+    constants are folded, x+0, 0+x, x-0, x*1, 1*x and x/1 become x, and the
+    operands of + and * are put in a fixed order. RAND is never folded, and
+    commutative operands are not swapped when both contain RAND, so the
+    canonical gene consumes random numbers in the same order.
+    '''
+    stack = list() # (canonical gene, key, constant value or None, contains RAND)
+    # evaluate the prefix expression right to left so children are reduced before parents
+    for primitive in reversed(gene):
+        if not is_operator(primitive):
+            if isinstance(primitive, str):
+                stack.append(([primitive], primitive, None, False))
+            else:
+                stack.append(([float(primitive)], repr(float(primitive)), float(primitive), False))
+            continue
+        left, right = stack.pop(), stack.pop()
+        if primitive != 'RAND' and left[2] is not None and right[2] is not None:
+            value = fold_constants(primitive, left[2], right[2])
+            stack.append(([value], repr(value), value, False))
+        elif (primitive in ('+', '-') and right[2] == 0) or (primitive in ('*', '/') and right[2] == 1):
+            stack.append(left)
+        elif (primitive == '+' and left[2] == 0) or (primitive == '*' and left[2] == 1):
+            stack.append(right)
+        else:
+            if primitive in ('+', '*') and not (left[3] and right[3]) and left[1] > right[1]:
+                left, right = right, left
+            stack.append(([primitive] + left[0] + right[0], f'({primitive} {left[1]} {right[1]})', None, primitive == 'RAND' or left[3] or right[3]))
+    canonical, key = stack.pop()[:2]
+    if isinstance(gene, PrefixGene):
+        canonical = PrefixGene.from_primitives(canonical)
+    return canonical, hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+def protected_divide(a, b):
+    '''elementwise a/b that yields 1 wherever b is 0'''
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+    return np.divide(a, b, out=np.ones_like(a), where=b != 0)
 
 class TreeGenotype():
     def __init__(self):
         self.fitness = None
         self.gene = None
 
-    def recombine(self, mate, **kwargs):
+    @property
+    def gene(self):
+        return self._gene
+
+    @gene.setter
+    def gene(self, gene):
+        # genes are stored as PrefixGene; reassigning one invalidates compiled evaluators and the canonical form
+        if gene is not None and not isinstance(gene, PrefixGene):
+            gene = PrefixGene.from_primitives(gene)
+        self._gene = gene
+        self._compiled = dict()
+        self._canonical = None
+
+    def canonical(self):
+        '''Returns the cached (canonical gene, canonical hash) of this individual (see canonical_form)'''
+        if self._canonical is None:
+            self._canonical = canonical_form(self.gene)
+        return self._canonical
+
+    def canonical_hash(self):
+        '''Hash shared by all genes with the same canonical form'''
+        return self.canonical()[1]
+
+    def compile(self, vectorized=False):
+        '''
+        Returns the cached evaluator of this individual's gene (see
+        compile_gene). Scores for s_primes are evaluate(sensor_rows).
+        '''
+        if vectorized not in self._compiled:
+            self._compiled[vectorized] = compile_gene(self.gene, vectorized)
+        return self._compiled[vectorized]
+
+    def recombine(self, mate, depth_limit=None, **kwargs):
+        '''
+        Subtree crossover bounded by depth_limit (by default the depth of the
+        deeper parent): the child is no deeper than depth_limit unless self
+        already is.
+        '''
         child = self.__class__()
 
-        # TODO: recombine genes of self and mate and assign to child's gene member variable
-        pass
+        # subtree crossover: replace a random subtree of self with a random subtree of mate short enough to fit
+        depths = self.gene.depths()
+        mate_heights = mate.gene.heights()
+        if depth_limit is None:
+            depth_limit = max(int(depths.max()), int(mate_heights[0]))
+        start = random.choice(np.flatnonzero(depths <= depth_limit).tolist())
+        mate_start = random.choice(np.flatnonzero(mate_heights <= depth_limit - depths[start]).tolist())
+        child.gene = self.gene.splice(start, mate.gene, mate_start)
 
         return child
 
-    def mutate(self, **kwargs):
+    def mutate(self, subtree_depth=3, depth_limit=None, **kwargs):
+        '''
+        Subtree mutation bounded by depth_limit (by default the larger of the
+        tree's depth and subtree_depth), like recombine.
+        '''
         copy = self.__class__()
 
-        # TODO: copy self.gene to copy.gene
-        pass
-
-        # TODO: mutate gene of copy
-        pass
+        # subtree mutation: replace a random subtree with a new grown one that fits within depth_limit
+        depths = self.gene.depths()
+        if depth_limit is None:
+            depth_limit = max(int(depths.max()), subtree_depth)
+        start = random.choice(np.flatnonzero(depths <= depth_limit).tolist())
+        copy.gene = self.gene.splice(start, PrefixGene.from_primitives(grow(min(subtree_depth, depth_limit - int(depths[start])))))
 
         return copy
 
     def print(self):
-        # TODO: return a string representation of self.gene
-        #       (see assignment description doc for more info)
-        pass
+        return self.gene.to_text()
+
+    @classmethod
+    def parse(cls, text):
+        '''Returns an individual with the gene printed as text (see print)'''
+        individual = cls()
+        individual.gene = PrefixGene.from_text(text)
+        return individual
 
     @classmethod
     def initialization(cls, mu, *args, **kwargs):
         population = [cls() for _ in range(mu)]
         depth_limit = kwargs['depth_limit']
-        # TODO: initialize gene member variables of individuals in 
-        # population using ramped half-and-half
-        pass
+        # ramped half-and-half: depths ramp over 1..depth_limit, alternating full and grow
+        for idx, individual in enumerate(population):
+            depth = 1 + (idx//2) % depth_limit
+            individual.gene = full(depth) if idx % 2 == 0 else grow(depth)
+
+        return population
+
 
-        return population
\ No newline at end of file
+if __name__ == '__main__':
+    random.seed(0)
+    population = TreeGenotype.initialization(20, depth_limit=5)
+    for genes in ([individual.gene for individual in population], [population[0].gene], []):
+        assert unpack_genes(pack_genes(genes)) == genes, f"ERROR: {len(genes)} GENES DID NOT ROUND-TRIP THROUGH pack_genes"
+    print('pack_genes round-trips')